@@ -0,0 +1,82 @@
+"""
+import-time budget for dash_access
+
+each statement is run in a fresh interpreter, several times;
+fails if the median import time is over budget, or if a heavy
+dependency is imported that the statement doesn't need
+
+python benchmarks/import_time.py [--runs 7] [--scale 1.0]
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# statement: (budget in milliseconds, modules it must not import)
+BUDGETS = {
+    "import dash_access": (10, ["dash", "pandas", "psycopg2", "boto3", "flask"]),
+    "from dash_access import AccessUserMixin": (
+        80,
+        ["dash", "pandas", "psycopg2", "boto3", "flask", "asyncio"],
+    ),
+    "from dash_access import Sqlite3AccessStore": (
+        60,
+        ["dash", "pandas", "psycopg2", "boto3", "asyncio"],
+    ),
+    "from dash_access import PostgresAccessStore": (
+        60,
+        ["dash", "pandas", "psycopg2", "boto3", "asyncio"],
+    ),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+took = time.perf_counter() - start
+print(json.dumps([took * 1000, sorted(m for m in {forbidden!r} if m in sys.modules)]))
+"""
+
+
+def measure(statement: str, forbidden: list, runs: int) -> tuple:
+    times = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                PROBE.format(statement=statement, forbidden=forbidden),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        took, imported = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(took)
+    return statistics.median(times), imported
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply budgets for slow machines"
+    )
+    args = parser.parse_args(argv)
+
+    failed = False
+    for statement, (budget, forbidden) in BUDGETS.items():
+        took, imported = measure(statement, forbidden, args.runs)
+        ok = took <= budget * args.scale and not imported
+        failed = failed or not ok
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {took:7.1f}ms / {budget * args.scale:5.0f}ms  "
+            f"{statement}" + (f"  (imported {', '.join(imported)})" if imported else "")
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,31 @@
-from .clients.sqlite3 import Sqlite3AccessStore
-from .clients.postgres import PostgresAccessStore
-from .access.user import AccessUserMixin
-from .access.control import Controlled
-from .auth import generate_password_hash, check_password_hash
+# exports are imported on first use, so `import dash_access` stays cheap
+# and backends like psycopg2 or Dash are only imported by the apps that use them
+_EXPORTS = {
+    "Sqlite3AccessStore": "dash_access.clients.sqlite3:Sqlite3AccessStore",
+    "AsyncSqlite3AccessStore": "dash_access.clients.sqlite3:AsyncSqlite3AccessStore",
+    "PostgresAccessStore": "dash_access.clients.postgres:PostgresAccessStore",
+    "AsyncPostgresAccessStore": "dash_access.clients.postgres:AsyncPostgresAccessStore",
+    "AccessUserMixin": "dash_access.access.user:AccessUserMixin",
+    "Controlled": "dash_access.access.control:Controlled",
+    "ControlledScope": "dash_access.access.control:ControlledScope",
+    "controlled_layout": "dash_access.access.control:controlled_layout",
+    "guarded_callback": "dash_access.access.control:guarded_callback",
+    "generate_password_hash": "dash_access.auth:generate_password_hash",
+    "check_password_hash": "dash_access.auth:check_password_hash",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if not name in _EXPORTS:
+        raise AttributeError(f"module 'dash_access' has no attribute '{name}'")
+    from dash_access.clients import load
+
+    value = load(_EXPORTS[name])
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
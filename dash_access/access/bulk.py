@@ -0,0 +1,182 @@
+"""
+Bulk export and import of relationships
+
+export streams the relationships table out in chunks, as JSON lines or CSV;
+load reads such a file back in batches, each written with one set_many,
+so each batch is one transaction and one admin event.
+Both return the file's sha256 so a backup can be checked before it's restored.
+
+**Example**:
+from dash_access.access import bulk
+
+with open("policy.jsonl", "wb") as f:
+    out = bulk.export(store, f)
+with open("policy.jsonl", "rb") as f:
+    bulk.load(other_store, f, checksum=out["sha256"])
+
+or, from the command line:
+python -m dash_access export --store sqlite:///local.sqlite3 --out policy.jsonl
+python -m dash_access import --store sqlite:///other.sqlite3 --in policy.jsonl
+"""
+
+import csv
+import io
+import json
+import hashlib
+
+# internal
+from dash_access.clients.base import BaseAccessStore
+from dash_access.access import relationship
+from dash_access.access.relationship import Args
+
+COLUMNS = ["id", "principal", "principal_type", "granted", "granted_type", "ts"]
+FORMATS = ["jsonl", "csv"]
+PRINCIPAL_TYPES = ["user", "group"]
+GRANTED_TYPES = ["group", "permission"]
+
+
+class ChecksumMismatch(ValueError):
+    """the file's sha256 isn't the one it was expected to have"""
+
+
+def _check_format(format: str):
+    if not format in FORMATS:
+        raise ValueError(f"bulk: format must be one of {', '.join(FORMATS)}")
+
+
+def _encode(rows: list, format: str, header: bool) -> bytes:
+    """a chunk of raw relationship rows as file bytes"""
+    if format == "jsonl":
+        return "".join(
+            [json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows]
+        ).encode("utf8")
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return out.getvalue().encode("utf8")
+
+
+def export(
+    store: BaseAccessStore, f, format: str = "jsonl", chunk_size: int = 10000
+) -> dict:
+    """
+    write every relationship to the binary file f, chunk_size rows at a time
+    returns {"rows": ..., "bytes": ..., "sha256": ...}
+    """
+    _check_format(format)
+    sha256 = hashlib.sha256()
+    rows = size = 0
+    if format == "csv":
+        # THE HEADER IS WRITTEN EVEN IF THERE ARE NO ROWS
+        data = _encode([], format, header=True)
+        f.write(data)
+        sha256.update(data)
+        size += len(data)
+    for chunk in store.iter_all(
+        "relationships", columns=COLUMNS, chunk_size=chunk_size
+    ):
+        data = _encode(chunk, format, header=False)
+        f.write(data)
+        sha256.update(data)
+        rows += len(chunk)
+        size += len(data)
+    return dict(rows=rows, bytes=size, sha256=sha256.hexdigest())
+
+
+def file_sha256(f, chunk_size: int = 1 << 20) -> str:
+    """the sha256 of the rest of the binary file f"""
+    sha256 = hashlib.sha256()
+    for data in iter(lambda: f.read(chunk_size), b""):
+        sha256.update(data)
+    return sha256.hexdigest()
+
+
+def _lines(f, sha256):
+    """the binary file's lines as text, hashing them on the way"""
+    for line in f:
+        sha256.update(line)
+        yield line.decode("utf8")
+
+
+def _records(lines, format: str):
+    """the file's rows as dicts"""
+    if format == "jsonl":
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(lines)
+
+
+def _val(record: dict, n: int) -> dict:
+    """input validation; the stored record of one row of the file"""
+    args = Args(
+        principal=record.get("principal"),
+        principal_type=record.get("principal_type"),
+        granted=record.get("granted"),
+        granted_type=record.get("granted_type"),
+    )
+    for name in ["principal", "principal_type", "granted", "granted_type"]:
+        if not isinstance(getattr(args, name), str) or not getattr(args, name):
+            raise ValueError(f"bulk: row {n} needs a {name}")
+    if not args.principal_type in PRINCIPAL_TYPES:
+        raise ValueError(
+            f"bulk: row {n} principal_type must be one of {', '.join(PRINCIPAL_TYPES)}"
+        )
+    if not args.granted_type in GRANTED_TYPES:
+        raise ValueError(
+            f"bulk: row {n} granted_type must be one of {', '.join(GRANTED_TYPES)}"
+        )
+    val = relationship._val(args)
+    # KEEP THE ORIGINAL TIMESTAMP ON RESTORE
+    if record.get("ts"):
+        val["ts"] = record["ts"]
+    return val
+
+
+def load(
+    store: BaseAccessStore,
+    f,
+    format: str = "jsonl",
+    batch_size: int = 5000,
+    dry_run: bool = False,
+    checksum: str = None,
+) -> dict:
+    """
+    create the relationships in the binary file f, batch_size at a time;
+    existing relationships with the same id are replaced
+
+    dry_run: read and validate every row but write nothing
+    checksum: the file's expected sha256; checked before anything is written,
+        so f must be seekable
+
+    returns {"rows": ..., "batches": ..., "sha256": ...}
+    """
+    _check_format(format)
+    if checksum is not None:
+        start = f.tell()
+        found = file_sha256(f)
+        if found != checksum.lower():
+            raise ChecksumMismatch(f"bulk: expected sha256 {checksum}, found {found}")
+        f.seek(start)
+
+    sha256 = hashlib.sha256()
+    rows = batches = 0
+    # ONE BATCH IS KEYED BY ID; A REPEATED ROW REPLACES THE EARLIER ONE
+    batch = {}
+    for n, record in enumerate(_records(_lines(f, sha256), format), start=1):
+        val = _val(record, n)
+        batch[val["id"]] = val
+        rows += 1
+        if len(batch) >= batch_size:
+            if not dry_run:
+                store.set_many("relationships", list(batch.values()))
+            batches += 1
+            batch = {}
+    if batch:
+        if not dry_run:
+            store.set_many("relationships", list(batch.values()))
+        batches += 1
+    return dict(rows=rows, batches=batches, sha256=sha256.hexdigest())
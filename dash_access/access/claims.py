@@ -0,0 +1,286 @@
+"""
+signed permission claims
+
+at login, the user's resolved permissions and the store's policy generation
+are signed with the app's secret key and kept in the session;
+AccessUserMixin.has_access then checks the claim locally and only goes to
+the store when the claim has expired or the generation has moved
+
+the store stays the source of truth: a claim is only trusted while it is
+younger than DASH_ACCESS_CLAIM_TTL seconds and the store's generation
+(see BaseAccessStore.generation) hasn't changed since it was issued
+
+**Example**:
+app = dash.Dash(__name__)
+claims.init_app(app.server, ttl=300)
+"""
+
+import hmac
+import json
+import time
+import base64
+import hashlib
+import datetime
+import flask
+from flask_login import user_logged_in, user_logged_out
+
+# internal
+from dash_access import metrics
+from dash_access import instrument
+from dash_access.access import user
+from dash_access.access.permission import PermissionSet
+
+SESSION_KEY = "dash_access_claim"
+
+# browsers drop cookies over 4KB, and the rest of the session (e.g. flask_login's
+# user id) goes with it, so bigger claims are kept for the request only
+MAX_BYTES = 3072
+
+
+def init_app(
+    app: flask.Flask,
+    ttl: int = 300,
+    log_access: bool = True,
+    max_bytes: int = MAX_BYTES,
+):
+    """
+    turn on signed permission claims for this app
+
+    ttl: seconds a claim is trusted before it is resolved again from the store
+    log_access: log access attempts answered from the claim to access_events,
+        in one batch when the request ends
+    max_bytes: largest signed claim put in the session cookie; users with
+        more permissions than fit are resolved from the store on each request
+    """
+    app.config["DASH_ACCESS_CLAIM_TTL"] = ttl
+    app.config["DASH_ACCESS_CLAIM_LOG_ACCESS"] = log_access
+    app.config["DASH_ACCESS_CLAIM_MAX_BYTES"] = max_bytes
+    user_logged_in.connect(_logged_in, app)
+    user_logged_out.connect(_logged_out, app)
+    app.teardown_request(_flush)
+
+
+def _logged_in(sender, user, **kwargs):
+    if hasattr(user, "__access_store__"):
+        issue(user)
+
+
+def _logged_out(sender, user, **kwargs):
+    clear()
+
+
+def _log(access_user, permission: str, status: bool):
+    """collect an access attempt answered from the claim, logged at teardown"""
+    if logs_access():
+        flask.g.setdefault("dash_access_claim_events", []).append(
+            (
+                access_user.store,
+                dict(
+                    user_id=access_user.id,
+                    permission=permission,
+                    ts=datetime.datetime.now().isoformat(),
+                    status=status,
+                ),
+            )
+        )
+
+
+def _flush(exc=None):
+    """log the request's collected access attempts, one batch per store"""
+    events = flask.g.pop("dash_access_claim_events", None)
+    if not events:
+        return
+    batches = {}
+    for store, event in events:
+        batches.setdefault(id(store), (store, []))[1].append(event)
+    for store, rows in batches.values():
+        user.permission_access_many(store, rows)
+
+
+def _enabled() -> bool:
+    return (
+        flask.has_request_context()
+        and flask.current_app.config.get("DASH_ACCESS_CLAIM_TTL") is not None
+    )
+
+
+def _generation(access_user):
+    """the store's generation, read once per request"""
+    generations = flask.g.setdefault("dash_access_generations", {})
+    key = id(access_user.store)
+    if not key in generations:
+        generations[key] = access_user.store.generation()
+    return generations[key]
+
+
+async def _generation_async(access_user):
+    """async version of _generation(), read from the user's async_store"""
+    generations = flask.g.setdefault("dash_access_generations", {})
+    key = id(access_user.store)
+    if not key in generations:
+        generations[key] = await access_user.async_store.generation()
+    return generations[key]
+
+
+def _signature(payload: bytes) -> str:
+    key = flask.current_app.secret_key
+    if key is None:
+        raise RuntimeError("signed permission claims need the app's secret_key")
+    if isinstance(key, str):
+        key = key.encode()
+    digest = hmac.new(key, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode()
+
+
+def issue(access_user, permissions: list = None, generation=None) -> dict:
+    """
+    resolve the user's permissions and store them as a signed claim in the session,
+    unless it's over the app's max_bytes; returns the claim
+
+    generation: the store generation the permissions were resolved at,
+        read from the store (once per request) if not given
+    """
+    store = access_user.store
+    if generation is None:
+        generation = _generation(access_user)
+    if permissions is None:
+        permissions = user.cached_permissions(
+            store, access_user.id, getattr(access_user, "permission_cache", None)
+        )
+    claim = {
+        "u": str(access_user.id),
+        "p": sorted(permissions),
+        "g": str(generation),
+        "e": int(time.time()) + flask.current_app.config["DASH_ACCESS_CLAIM_TTL"],
+    }
+    payload = json.dumps(claim, separators=(",", ":"), sort_keys=True).encode()
+    signed = {
+        "c": payload.decode(),
+        "s": _signature(payload),
+    }
+    max_bytes = flask.current_app.config.get("DASH_ACCESS_CLAIM_MAX_BYTES", MAX_BYTES)
+    if len(json.dumps(signed)) > max_bytes:
+        # TOO BIG FOR THE COOKIE - ONLY THIS REQUEST USES IT
+        flask.session.pop(SESSION_KEY, None)
+    else:
+        flask.session[SESSION_KEY] = signed
+    flask.g.dash_access_claim = claim
+    return claim
+
+
+def read(access_user, generation=None) -> dict:
+    """
+    the user's claim from the session if it is signed, current and theirs
+    otherwise None
+
+    generation: the store's current generation, read from the store
+        (once per request) if not given
+    """
+    claim = flask.g.get("dash_access_claim")
+    if claim is None:
+        signed = flask.session.get(SESSION_KEY)
+        if not signed:
+            return None
+        payload = signed["c"].encode()
+        if not hmac.compare_digest(_signature(payload), signed["s"]):
+            return None
+        claim = json.loads(payload)
+
+    # IS IT STILL GOOD?
+    if claim["u"] != str(access_user.id) or claim["e"] < time.time():
+        return None
+    if generation is None:
+        generation = _generation(access_user)
+    if claim["g"] != str(generation):
+        return None
+
+    flask.g.dash_access_claim = claim
+    return claim
+
+
+def clear():
+    """drop the claim from the session"""
+    flask.session.pop(SESSION_KEY, None)
+    flask.g.pop("dash_access_claim", None)
+    flask.g.pop("dash_access_permission_set", None)
+
+
+def _permission_set(claim: dict) -> PermissionSet:
+    """the claim's permissions compiled once per request"""
+    cached = flask.g.get("dash_access_permission_set")
+    if cached is None or cached[0] is not claim:
+        cached = (claim, PermissionSet(claim["p"]))
+        flask.g.dash_access_permission_set = cached
+    return cached[1]
+
+
+def logs_access() -> bool:
+    """are checks answered from claims logged to access_events?"""
+    return bool(flask.current_app.config.get("DASH_ACCESS_CLAIM_LOG_ACCESS"))
+
+
+def permission_set(access_user) -> PermissionSet:
+    """
+    the permissions in the user's signed claim,
+    reissuing the claim first if it has expired or the generation has moved
+
+    returns None if claims are not turned on for the app
+    """
+    if not _enabled():
+        return None
+    claim = read(access_user)
+    metrics.cache("claim", claim is not None)
+    if claim is None:
+        claim = issue(access_user)
+    return _permission_set(claim)
+
+
+def has_access(access_user, permission: str) -> bool:
+    """
+    check the permission against the user's signed claim,
+    reissuing the claim first if it has expired or the generation has moved
+
+    returns None if claims are not turned on for the app,
+    so the caller can go to the store instead
+    """
+    if not _enabled() or permission is None:
+        return None
+    start = time.perf_counter()
+
+    permissions = permission_set(access_user)
+    user_has_access = user.permitted(permissions, permission)
+
+    # LOG permission ACCESS ATTEMPT
+    _log(access_user, permission, user_has_access)
+    instrument.access_decision(
+        user_has_access, len(permissions), time.perf_counter() - start
+    )
+    return user_has_access
+
+
+async def has_access_async(access_user, permission: str) -> bool:
+    """
+    async version of has_access(); the generation is read and a stale claim
+    is resolved again on the user's async_store, so the event loop isn't blocked
+    """
+    if not _enabled() or permission is None:
+        return None
+    start = time.perf_counter()
+
+    store = access_user.async_store
+    generation = await _generation_async(access_user)
+    claim = read(access_user, generation)
+    metrics.cache("claim", claim is not None)
+    if claim is None:
+        permissions = await user.cached_permissions_async(
+            store, access_user.id, getattr(access_user, "permission_cache", None)
+        )
+        claim = issue(access_user, permissions, generation)
+    user_has_access = user.permitted(_permission_set(claim), permission)
+
+    # LOG permission ACCESS ATTEMPT
+    _log(access_user, permission, user_has_access)
+    instrument.access_decision(
+        user_has_access, len(claim["p"]), time.perf_counter() - start
+    )
+    return user_has_access
@@ -0,0 +1,359 @@
+"""
+Compiled policy files
+
+`python -m dash_access compile` resolves every user's and group's permissions
+from the store and writes them to a single read-only binary file.
+Workers mmap the file, so they start without resolving anything
+and share one page-cache copy of the policy.
+
+File layout, all integers little-endian:
+    header      magic, version, counts, bitset stride and section offsets
+    index       (offset, length) of each string in the strings section
+    strings     utf-8 strings in index order:
+                    the store generation the file was compiled at,
+                    the interned permission names,
+                    user ids, sorted by their utf-8 bytes,
+                    group names, sorted by their utf-8 bytes
+    bitsets     one row of `stride` bytes per user, then per group;
+                bit i is set if permission i is granted, directly or through groups
+
+The file is published by writing a temporary file next to it and renaming it
+over the old one, so readers never see a partial file; CompiledPolicy reopens
+the file when a newer one appears.
+"""
+
+import os
+import mmap
+import time
+import struct
+import tempfile
+from typing import NamedTuple
+
+# internal
+from dash_access.clients.base import BaseAccessStore
+from dash_access.access.permission import wildcards
+
+MAGIC = b"DAPOLICY"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIIQQQ")
+ENTRY = struct.Struct("<II")
+
+
+def _closures(ships: list) -> tuple:
+    """
+    resolve the relationships into
+    each user's and each group's full set of permissions
+    """
+    grants = {}
+    for principal, principal_type, granted, granted_type in ships:
+        grants.setdefault((principal, principal_type), []).append(
+            (granted, granted_type)
+        )
+
+    def resolve(start):
+        found = set()
+        seen = {start}
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for principal in frontier:
+                for granted, granted_type in grants.get(principal, []):
+                    if granted_type == "permission":
+                        found.add(granted)
+                    elif granted_type == "group":
+                        key = (granted, "group")
+                        if not key in seen:
+                            seen.add(key)
+                            next_frontier.append(key)
+            frontier = next_frontier
+        return found
+
+    users = {}
+    groups = {}
+    for principal, principal_type in grants:
+        if principal_type == "user":
+            users[principal] = resolve((principal, "user"))
+        elif principal_type == "group":
+            groups[principal] = resolve((principal, "group"))
+    return users, groups
+
+
+def build(store: BaseAccessStore) -> bytes:
+    """the compiled policy file for the store's current relationships"""
+    if not store.has_generation:
+        raise ValueError(
+            f"compile: {type(store).__name__} has no policy generation, "
+            "so a policy compiled from it could never be seen to be stale"
+        )
+    # read the generation first, so a change made while compiling leaves the file stale
+    generation = str(store._generation())
+    ships = store.get_all(
+        "relationships",
+        columns=["principal", "principal_type", "granted", "granted_type"],
+        raw=True,
+    )
+    users, groups = _closures(ships)
+
+    # INTERN PERMISSIONS
+    permissions = sorted(set().union(*users.values(), *groups.values()))
+    positions = {name: i for i, name in enumerate(permissions)}
+    stride = (len(permissions) + 7) // 8
+
+    user_ids = sorted(users, key=lambda x: x.encode())
+    group_names = sorted(groups, key=lambda x: x.encode())
+    strings = [generation, *permissions, *user_ids, *group_names]
+
+    # STRINGS AND INDEX
+    index = bytearray()
+    blob = bytearray()
+    for s in strings:
+        encoded = s.encode()
+        index += ENTRY.pack(len(blob), len(encoded))
+        blob += encoded
+
+    # BITSETS
+    bitsets = bytearray()
+    for granted in [users[x] for x in user_ids] + [groups[x] for x in group_names]:
+        bits = 0
+        for name in granted:
+            bits |= 1 << positions[name]
+        bitsets += bits.to_bytes(stride, "little")
+
+    index_offset = HEADER.size
+    strings_offset = index_offset + len(index)
+    bitsets_offset = strings_offset + len(blob)
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(permissions),
+        len(user_ids),
+        len(group_names),
+        stride,
+        index_offset,
+        strings_offset,
+        bitsets_offset,
+    )
+    return header + bytes(index) + bytes(blob) + bytes(bitsets)
+
+
+def publish(path: str, data: bytes):
+    """atomically replace the file at path with data"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".dash_access-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def compile(store: BaseAccessStore, path: str) -> dict:
+    """compile the store's policy and publish it to path"""
+    data = build(store)
+    publish(path, data)
+    policy = CompiledPolicy(path)
+    return dict(
+        path=path,
+        bytes=len(data),
+        generation=policy.generation,
+        permissions=len(policy.permission_names),
+        users=policy.n_users,
+        groups=policy.n_groups,
+    )
+
+
+class _Layout(NamedTuple):
+    """
+    one opened policy file; CompiledPolicy swaps in a new one on refresh,
+    so a check that holds a layout never sees parts of two files
+    """
+
+    mm: mmap.mmap
+    stat: tuple
+    generation: str
+    permission_names: list
+    positions: dict
+    n_users: int
+    n_groups: int
+    stride: int
+    index_offset: int
+    strings_offset: int
+    bitsets_offset: int
+    users_start: int
+    groups_start: int
+
+    def string(self, i: int) -> bytes:
+        offset, length = ENTRY.unpack_from(self.mm, self.index_offset + i * ENTRY.size)
+        start = self.strings_offset + offset
+        return self.mm[start : start + length]
+
+    def row(self, name: str, start: int, n: int) -> int:
+        """binary search for name among the n sorted strings from start"""
+        target = name.encode()
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(start + mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < n and self.string(start + lo) == target:
+            return lo
+        return None
+
+    def bits(self, row: int) -> int:
+        start = self.bitsets_offset + row * self.stride
+        return int.from_bytes(self.mm[start : start + self.stride], "little")
+
+    def bit(self, row: int, i: int) -> bool:
+        byte = self.mm[self.bitsets_offset + row * self.stride + i // 8]
+        return bool(byte >> (i % 8) & 1)
+
+    def names(self, bits: int) -> list:
+        return [name for i, name in enumerate(self.permission_names) if bits >> i & 1]
+
+
+def _open(path: str) -> _Layout:
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    (
+        magic,
+        version,
+        n_permissions,
+        n_users,
+        n_groups,
+        stride,
+        index_offset,
+        strings_offset,
+        bitsets_offset,
+    ) = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} policy file")
+
+    # THE STRINGS ARE READ WITH THE LAYOUT ITSELF, THEN FILLED IN
+    layout = _Layout(
+        mm=mm,
+        stat=(stat.st_ino, stat.st_mtime_ns),
+        generation=None,
+        permission_names=None,
+        positions=None,
+        n_users=n_users,
+        n_groups=n_groups,
+        stride=stride,
+        index_offset=index_offset,
+        strings_offset=strings_offset,
+        bitsets_offset=bitsets_offset,
+        users_start=1 + n_permissions,
+        groups_start=1 + n_permissions + n_users,
+    )
+    permission_names = [layout.string(1 + i).decode() for i in range(n_permissions)]
+    return layout._replace(
+        generation=layout.string(0).decode(),
+        permission_names=permission_names,
+        positions={name: i for i, name in enumerate(permission_names)},
+    )
+
+
+class CompiledPolicy(object):
+    """
+    read-only view of a compiled policy file
+
+    the file is mmap'd, so worker processes share its pages;
+    every check_interval seconds it checks whether a newer file
+    was published at path and reopens it if so
+
+    **Example**:
+    class User(UserMixin, db.Model, AccessUserMixin):
+        __access_store__ = PostgresAccessStore(db)
+        __access_policy__ = CompiledPolicy("/srv/policy.bin")
+    """
+
+    def __init__(self, path: str, check_interval: int = 5):
+        self.path = path
+        self.check_interval = check_interval
+        self.open()
+
+    def open(self):
+        # ONE ASSIGNMENT, SO CONCURRENT CHECKS SEE THE OLD FILE OR THE NEW ONE
+        self._layout = _open(self.path)
+        self._checked = time.monotonic()
+
+    @property
+    def generation(self) -> str:
+        return self._layout.generation
+
+    @property
+    def permission_names(self) -> list:
+        return self._layout.permission_names
+
+    @property
+    def positions(self) -> dict:
+        return self._layout.positions
+
+    @property
+    def n_users(self) -> int:
+        return self._layout.n_users
+
+    @property
+    def n_groups(self) -> int:
+        return self._layout.n_groups
+
+    def refresh(self) -> bool:
+        """reopen the file if a newer one was published; True if it was"""
+        self._checked = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns) == self._layout.stat:
+            return False
+        self.open()
+        return True
+
+    def _maybe_refresh(self) -> _Layout:
+        """the current layout, reopening the file first if it's time to check"""
+        if time.monotonic() - self._checked > self.check_interval:
+            self.refresh()
+        return self._layout
+
+    def current(self, generation) -> bool:
+        """was the file compiled at this store generation?"""
+        return self._maybe_refresh().generation == str(generation)
+
+    def permitted(self, user_id: str, permission: str) -> bool:
+        """
+        does the user have the permission, directly, through "*"
+        or through a wildcard over its namespace?
+        only the bits of those names are read
+        """
+        layout = self._maybe_refresh()
+        row = layout.row(str(user_id), layout.users_start, layout.n_users)
+        if row is None:
+            return False
+        for name in [permission, *wildcards(permission)]:
+            i = layout.positions.get(name)
+            if i is not None and layout.bit(row, i):
+                return True
+        return False
+
+    def permissions(self, user_id: str) -> list:
+        """all the direct and indirect permissions of the user"""
+        layout = self._maybe_refresh()
+        row = layout.row(str(user_id), layout.users_start, layout.n_users)
+        if row is None:
+            return []
+        return layout.names(layout.bits(row))
+
+    def group_permissions(self, name: str) -> list:
+        """all the direct and inherited permissions of the group"""
+        layout = self._maybe_refresh()
+        row = layout.row(name, layout.groups_start, layout.n_groups)
+        if row is None:
+            return []
+        return layout.names(layout.bits(layout.n_users + row))
@@ -1,10 +1,209 @@
+import time
+import datetime
+import inspect
+import functools
+from contextvars import ContextVar
 from dash import html
 from dash import dcc
+from dash.exceptions import PreventUpdate
 from flask_login import current_user
 
 # internal
+from dash_access import metrics
+from dash_access import instrument
 from dash_access.access.data import data_access
 from dash_access.access import user
+from dash_access.access import claims
+
+_scope = ContextVar("dash_access_controlled_scope", default=None)
+
+
+class ControlledScope(object):
+    """
+    resolve the current user's permissions once for a whole layout
+
+    every Controlled rendered inside the scope checks against the user's
+    permissions, resolved once on the first check, instead of resolving
+    them again for each component; the access attempts are collected and
+    logged together when the scope exits
+
+    the permissions come from the same places, in the same order, as
+    AccessUserMixin.has_access: the signed claim, then a current compiled
+    policy, then the permission cache or the store
+
+    **Example**:
+    def home():
+        with ControlledScope():
+            return html.Div([
+                Controlled("level1", "div", html.H1("Need level1 access")),
+                Controlled("level2", "div", html.H1("Need level2 access")),
+            ])
+    """
+
+    def __init__(self, access_user=None):
+        # the user with the AccessUserMixin; defaults to flask_login.current_user
+        self.access_user = access_user
+        self.permissions = None
+        # the compiled policy answering the checks, if it was current
+        self.policy = None
+        self.resolved = False
+        self.log = True
+        self.events = []
+
+    def __enter__(self):
+        self._token = _scope.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _scope.reset(self._token)
+        self.flush()
+        return False
+
+    def _access_user(self):
+        return current_user if self.access_user is None else self.access_user
+
+    def has_access(self, name: str) -> bool:
+        u = self._access_user()
+        if not hasattr(u, "store"):
+            # NOT AN AccessUserMixin - FALL BACK TO ITS OWN CHECK
+            return u.has_access(name)
+
+        start = time.perf_counter()
+        if not self.resolved:
+            self._resolve(u)
+        if self.policy is not None:
+            status = self.policy.permitted(u.id, name)
+            n_permissions = None
+        else:
+            status = user.permitted(self.permissions, name)
+            n_permissions = len(self.permissions)
+        instrument.access_decision(status, n_permissions, time.perf_counter() - start)
+        if self.log:
+            self.events.append(
+                dict(
+                    user_id=u.id,
+                    permission=name,
+                    ts=datetime.datetime.now().isoformat(),
+                    status=status,
+                )
+            )
+        return status
+
+    def _resolve(self, u):
+        """find where the user's permissions come from, as AccessUserMixin does"""
+        self.resolved = True
+        self.permissions = claims.permission_set(u)
+        if self.permissions is not None:
+            # CHECKS ANSWERED FROM THE CLAIM FOLLOW ITS LOGGING SETTING
+            self.log = claims.logs_access()
+            return
+        policy = getattr(u, "policy", None)
+        if policy is not None:
+            current = u.store.has_generation and policy.current(u.store.generation())
+            metrics.cache("policy", current)
+            if current:
+                self.policy = policy
+                return
+        self.permissions = user.cached_permissions(
+            u.store, u.id, getattr(u, "permission_cache", None)
+        )
+
+    def flush(self):
+        """log the collected access attempts in one batch"""
+        if self.events:
+            user.permission_access_many(self._access_user().store, self.events)
+            self.events = []
+
+
+def controlled_layout(fn):
+    """
+    decorator: render the layout function inside a ControlledScope,
+    so all its Controlled components share one permission resolution
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with ControlledScope():
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _build(value):
+    """the value, or what it builds if it's a component factory"""
+    # dash components aren't callable, so anything callable is a factory
+    return value() if callable(value) else value
+
+
+def _denied(on_deny, args, kwargs):
+    """what a guarded callback returns instead of running"""
+    if on_deny is None:
+        # NOTHING IS UPDATED - LIKE RETURNING no_update FOR EVERY OUTPUT
+        raise PreventUpdate
+    if callable(on_deny):
+        return on_deny(*args, **kwargs)
+    return on_deny
+
+
+def guarded_callback(app, *args, permission: str, on_deny=None, func=None, **kwargs):
+    """
+    app.callback, but the callback only runs if the current user has the permission
+
+    the access check happens before the callback is called, so users without
+    access (or whose session has expired) don't cost an expensive query or figure
+
+    arguments
+        app: the Dash app (or anything with a .callback, e.g. dash.callback's module)
+        args, kwargs: passed to app.callback (Output, Input, State, ...)
+        permission: str
+            - the permission the user needs for the callback to run
+        on_deny:
+            - None: update nothing (raises PreventUpdate)
+            - a function: called with the callback's arguments; its result is returned
+            - anything else: returned as the callback's output, e.g. no_update or a
+              tuple with one value per Output
+        func:
+            - a function used to check if the user has access
+            - use if you don't want to use the current_user system
+
+    **Example**:
+    @guarded_callback(app, Output("graph", "figure"), Input("year", "value"), permission="reports.finance")
+    def update_graph(year):
+        return expensive_figure(year)
+    """
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*a, **kw):
+                if func is not None:
+                    allowed = func(permission)
+                elif getattr(current_user, "is_authenticated", False):
+                    allowed = await current_user.has_access_async(permission)
+                else:
+                    allowed = False
+                if not allowed:
+                    return _denied(on_deny, a, kw)
+                return await fn(*a, **kw)
+
+            return app.callback(*args, **kwargs)(async_wrapper)
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if func is not None:
+                allowed = func(permission)
+            elif getattr(current_user, "is_authenticated", False):
+                allowed = current_user.has_access(permission)
+            else:
+                allowed = False
+            if not allowed:
+                return _denied(on_deny, a, kw)
+            return fn(*a, **kw)
+
+        return app.callback(*args, **kwargs)(wrapper)
+
+    return decorator
 
 
 def Controlled(
@@ -28,9 +227,11 @@ def Controlled(
         component:
             - object subclassing dash.development.base_component.Component or a JSON-serializable type
             - the component to return if the user has access to it
+            - or a zero-argument function that builds it, only called if the user has access
         custom_value:
             - object subclassing dash.development.base_component.Component or a JSON-serializable type
             - something custom to return if the user doesn't have access
+            - or a zero-argument function that builds it, only called if it's returned
             - only used if alt="custom"
         func:
             - a function used to check if the user has access
@@ -44,13 +245,16 @@ def Controlled(
         pass
 
     elif current_user.is_authenticated:
-        if func is None:
+        scope = _scope.get()
+        if func is None and scope is not None:
+            permission_access = scope.has_access(name)
+        elif func is None:
             permission_access = current_user.has_access(name)
         else:
             permission_access = func(name)
 
         if permission_access:
-            ret = component
+            ret = _build(component)
 
         else:
             # RETURN A BLANK DIV, SHOWING NOTHING ON SCREEN
@@ -68,6 +272,6 @@ def Controlled(
                 )
 
             elif alt == "custom":
-                return custom_value
+                return _build(custom_value)
 
     return ret
@@ -1,15 +1,94 @@
 import os
+import sys
+import time
 import datetime
-import pandas
+import threading
 import json
+from collections import OrderedDict
 from flask_login import current_user
 from functools import wraps
 
 # internal
+from dash_access import metrics
 from dash_access.access import user
 
 
-def data_access(asset):
+def nbytes(val) -> int:
+    """
+    rough size in bytes of a cached result
+    deep memory usage for DataFrames and Series, the buffer size for arrays
+    """
+    if hasattr(val, "memory_usage"):
+        usage = val.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(val, "nbytes"):
+        return int(val.nbytes)
+    return sys.getsizeof(val)
+
+
+class ResultCache(object):
+    """
+    LRU cache of data_access results, bounded by count and by size in bytes
+
+    each entry remembers the store generation it was computed under,
+    so results are dropped as soon as grants change, as well as after ttl seconds
+    """
+
+    def __init__(self, ttl: int = 300, maxsize: int = 128, max_bytes: int = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        """the cached value, or None if there is none or it is stale"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            val, size, expires, entry_generation = entry
+            if expires < time.monotonic() or entry_generation != generation:
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return val
+
+    def set(self, key, generation, val):
+        size = nbytes(val)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._pop(key)
+            self.entries[key] = (val, size, time.monotonic() + self.ttl, generation)
+            self.bytes += size
+
+            # EVICT LEAST RECENTLY USED
+            while len(self.entries) > self.maxsize or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self.entries)))
+
+    def _pop(self, key):
+        val, size, expires, generation = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+def data_access(
+    asset,
+    cache: bool = False,
+    ttl: int = 300,
+    maxsize: int = 128,
+    max_bytes: int = None,
+    scope: str = None,
+):
     """
     This wrapper manages access for access-controlled data retrieval functions.
 
@@ -30,6 +109,13 @@ def data_access(asset):
         - pass the asset name into the decorator at definition
         - should deal with the access failure value
 
+    With cache=True, results are shared between all permitted users
+    and kept for ttl seconds, up to maxsize results and max_bytes bytes.
+    They're keyed on the asset and the function's arguments; if the result
+    depends on the user, name the current_user attribute it depends on in scope.
+    Results are dropped when permission grants change (see BaseAccessStore.generation).
+    Clear the cache with get_revenue_data.cache.clear()
+
     **Example**:
     from system import data_access
     @data_access('revenue')
@@ -38,25 +124,54 @@ def data_access(asset):
         some_field = current_user.some_field
         data = pd.read_csv(f'path/to/{some_field}/revenue.csv')
         return data
+
+    @data_access('revenue', cache=True, ttl=600, scope='some_field')
+    def get_revenue_data():
+        ...
     """
 
     def decorated(f):
+        results = ResultCache(ttl=ttl, maxsize=maxsize, max_bytes=max_bytes)
+
+        @wraps(f)
         def wrapper(*args, **kwargs):
             if not hasattr(current_user, "id"):
                 # TODO add proper response
                 return None
 
             # CHECK USER ACCESS RIGHTS
-            has_access = current_user.has_access(current_user.id, asset)
+            has_access = current_user.has_access(asset)
 
             # RETURN IF USER DOES NOT HAVE ACCESS
             if not has_access:
                 return None
 
             # RETURN FUNCTION AS NORMAL OTHERWISE
-            else:
+            if not cache:
+                return f(*args, **kwargs)
+
+            # OR THE CACHED RESULT, IF ANY
+            key = (
+                asset,
+                args,
+                tuple(sorted(kwargs.items())),
+                getattr(current_user, scope) if scope else None,
+            )
+            try:
+                hash(key)
+            except TypeError:
+                # unhashable arguments can't be cached
                 return f(*args, **kwargs)
+            generation = current_user.store.generation()
+            val = results.get(key, generation)
+            metrics.cache("data", val is not None)
+            if val is None:
+                val = f(*args, **kwargs)
+                if val is not None:
+                    results.set(key, generation, val)
+            return val
 
+        wrapper.cache = results
         return wrapper
 
     return decorated
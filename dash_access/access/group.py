@@ -5,6 +5,7 @@ from dash_access.clients.base import BaseAccessStore
 from dash_access.access.relationship import (
     Args,
     create,
+    create_if_not_exists,
     delete,
     delete_all,
     exists,
@@ -41,8 +42,7 @@ def add(
     # DEFINE THE GROUP-USER RELATIONSHIPS
     for x in users:
         args = Args(x, "user", name, "group")
-        if not exists(store, args):
-            create(store, args)
+        create_if_not_exists(store, args)
 
     # DEFINE THE GROUP-GROUP INHERITS RELATIONSHIPS
     add_inherits(store, name, inherits=inherits)
@@ -52,8 +52,7 @@ def add(
 def add_inherits(store: BaseAccessStore, name: str, inherits: list = []) -> bool:
     for gname in inherits:
         args = Args(name, "group", gname, "group")
-        if not exists(store, args):
-            create(store, args)
+        create_if_not_exists(store, args)
     return True
 
 
@@ -66,8 +65,7 @@ def remove_inherits(store: BaseAccessStore, name: str, remove: list = []) -> boo
 def add_permissions(store: BaseAccessStore, name: str, permissions: list = []) -> bool:
     for x in permissions:
         args = Args(name, "group", x, "permission")
-        if not exists(store, args):
-            create(store, args)
+        create_if_not_exists(store, args)
     return True
 
 
@@ -82,8 +80,7 @@ def remove_permissions(
 def add_users(store: BaseAccessStore, name: str, users: list = []) -> bool:
     for x in users:
         args = Args(x, "user", name, "group")
-        if not exists(store, args):
-            create(store, args)
+        create_if_not_exists(store, args)
     return True
 
 
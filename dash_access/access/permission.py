@@ -0,0 +1,135 @@
+import sys
+from typing import Iterator
+
+# internal
+from dash_access.clients.base import BaseAccessStore
+
+# only these are needed to walk the grants backwards
+PRINCIPAL_COLUMNS = ["principal", "principal_type"]
+
+# permission names are hierarchical, e.g. "reports.finance.q1";
+# "reports.*" grants everything under reports, and "*" grants everything
+SEPARATOR = "."
+WILDCARD = "*"
+
+# marks a trie node whose whole namespace is granted
+_GRANTED = None
+
+
+def wildcards(name: str) -> list:
+    """
+    the wildcard grants that cover the permission, broadest first
+    e.g. "*", "reports.*", "reports.finance.*" for "reports.finance.q1"
+    """
+    parts = name.split(SEPARATOR)
+    return [WILDCARD] + [
+        SEPARATOR.join(parts[:i] + [WILDCARD]) for i in range(1, len(parts))
+    ]
+
+
+class PermissionSet(object):
+    """
+    a user's resolved permissions, compiled for checking
+
+    exact names are kept in a set; wildcard grants are kept in a trie of
+    name segments, so a check walks at most the depth of the name
+    however many wildcards the user has been granted
+    """
+
+    __slots__ = ("names", "trie", "everything")
+
+    def __init__(self, names=()):
+        self.names = set()
+        self.trie = {}
+        self.everything = False
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str):
+        self.names.add(name)
+        if name == WILDCARD:
+            self.everything = True
+        elif name.endswith(SEPARATOR + WILDCARD):
+            node = self.trie
+            for part in name[: -len(SEPARATOR + WILDCARD)].split(SEPARATOR):
+                node = node.setdefault(part, {})
+            node[_GRANTED] = True
+
+    def __contains__(self, name: str) -> bool:
+        if self.everything or name in self.names:
+            return True
+        # WALK THE NAMESPACES ABOVE THE NAME, LOOKING FOR A WILDCARD GRANT
+        node = self.trie
+        for part in name.split(SEPARATOR)[:-1]:
+            node = node.get(part)
+            if node is None:
+                return False
+            if _GRANTED in node:
+                return True
+        return False
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return f"PermissionSet({sorted(self.names)})"
+
+    @property
+    def nbytes(self) -> int:
+        """rough size in bytes, for caches bounded by size"""
+        return sys.getsizeof(self.names) + sys.getsizeof(self.trie)
+
+
+def _granted_wheres(frontier: list) -> list:
+    """one relationships where per (granted, granted_type)"""
+    return [
+        [
+            {"col": "granted", "val": granted},
+            {"col": "granted_type", "val": granted_type},
+        ]
+        for granted, granted_type in frontier
+    ]
+
+
+def holders(
+    store: BaseAccessStore, name: str, include_wildcard: bool = True
+) -> Iterator[str]:
+    """
+    yield each user who has the permission, directly or through groups
+
+    walk the grants backwards, level by level, starting from the permission
+    (and the wildcards that cover it, like "reports.*" and "*"):
+    each level's lookups on (granted, granted_type) go together in one get_all_many;
+    users are yielded as soon as they're found, groups are queued for the next level
+
+    **Example**:
+    for user_id in permission.holders(store, "classified"):
+        ...
+    """
+    frontier = [(name, "permission")]
+    if include_wildcard:
+        frontier += [(x, "permission") for x in wildcards(name) if x != name]
+    seen_users = set()
+    seen_groups = set()
+    while frontier:
+        levels = store.get_all_many(
+            table="relationships",
+            wheres=_granted_wheres(frontier),
+            columns=PRINCIPAL_COLUMNS,
+            raw=True,
+        )
+        next_groups = set()
+        for ships in levels:
+            for principal, principal_type in ships:
+                if principal_type == "user":
+                    if not principal in seen_users:
+                        seen_users.add(principal)
+                        yield principal
+                elif principal_type == "group":
+                    if not principal in seen_groups:
+                        next_groups.add(principal)
+        seen_groups |= next_groups
+        frontier = [(x, "group") for x in next_groups]
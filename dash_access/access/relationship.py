@@ -9,6 +9,7 @@ from typing import List
 
 # internal
 from dash_access.clients.base import BaseAccessStore
+from dash_access.records import Relationship
 
 #################################################################################
 ### OPERATIONAL FUNCTIONALITY
@@ -17,6 +18,7 @@ from dash_access.clients.base import BaseAccessStore
 class Args:
     """
     simpler input arguments to all relationship functions
+    a dash_access.records.Relationship is accepted anywhere Args is
     """
 
     principal: str = None
@@ -41,6 +43,25 @@ def _value_check(value, okay: list, name):
         raise TypeError(f"Incorrect {name}, needs to be one of {str(okay)}")
 
 
+def _key(args: Args) -> str:
+    """the combo id key of a relationship"""
+    return "-".join(
+        [args.principal, args.principal_type, args.granted, args.granted_type]
+    )
+
+
+def _val(args: Args) -> dict:
+    """the stored record of a relationship"""
+    return {
+        "id": _key(args),
+        "principal": args.principal,
+        "principal_type": args.principal_type,
+        "granted": args.granted,
+        "granted_type": args.granted_type,
+        "ts": datetime.datetime.now().isoformat(),
+    }
+
+
 def create(
     store: BaseAccessStore,
     args: Args,
@@ -50,24 +71,36 @@ def create(
     for the given principal and granted types
     """
     # print(f'creating relationship {principal_type} {principal} to {granted_type} {granted}')
-    return store.set(
-        key="-".join(
-            [args.principal, args.principal_type, args.granted, args.granted_type]
-        ),
-        table="relationships",
-        val={
-            "id": "-".join(
-                [args.principal, args.principal_type, args.granted, args.granted_type]
-            ),
-            "principal": args.principal,
-            "principal_type": args.principal_type,
-            "granted": args.granted,
-            "granted_type": args.granted_type,
-            "ts": datetime.datetime.now().isoformat(),
-        },
+    return store.set(key=_key(args), table="relationships", val=_val(args))
+
+
+def create_if_not_exists(
+    store: BaseAccessStore,
+    args: Args,
+) -> bool:
+    """
+    creates a relationship only if it doesn't exist yet
+    returns False if it already existed
+
+    stores with conditional writes do this in one request
+    instead of an exists() check followed by a create()
+    """
+    return store.set_if_not_exists(
+        key=_key(args), table="relationships", val=_val(args)
     )
 
 
+def create_many(
+    store: BaseAccessStore,
+    args: List[Args],
+) -> bool:
+    """
+    creates many relationships at once
+    stores with bulk writes send them in batches
+    """
+    return store.set_many(table="relationships", vals=[_val(x) for x in args])
+
+
 def exists(
     store: BaseAccessStore,
     args: Args,
@@ -78,24 +111,14 @@ def exists(
 
     if the combo id key exists, the relationship exists
     """
-    res = store.get(
-        key="-".join(
-            [args.principal, args.principal_type, args.granted, args.granted_type]
-        ),
-        table="relationships",
-    ) not in (None, [])
+    res = store.get(key=_key(args), table="relationships") not in (None, [])
     return res
 
 
-def get_all(
-    store: BaseAccessStore,
-    args: Args,
-) -> List[str]:
+def _where(args: Args) -> list:
     """
-    get all relationships where the given constraints are met
-    if no constraints are provided, returns all relationships
+    input validation; the where list for the given constraints
     """
-    # INPUT VALIDATION AND CONSTRUCT WHERE
     where = []
     if args.principal:
         _type_check(args.principal, str, "principal")
@@ -109,9 +132,31 @@ def get_all(
     if args.granted_type:
         _type_check(args.granted_type, str, "granted_type")
         where.append({"col": "granted_type", "val": args.granted_type})
+    return where
+
 
-    val = store.get_all(table="relationships", where=where)
-    return [x["granted"] for x in val]
+def get_all(
+    store: BaseAccessStore,
+    args: Args,
+) -> List[str]:
+    """
+    get all relationships where the given constraints are met
+    if no constraints are provided, returns all relationships
+    """
+    val = store.get_all(
+        table="relationships", where=_where(args), columns=["granted"], raw=True
+    )
+    return [x[0] for x in val]
+
+
+def get_all_records(
+    store: BaseAccessStore,
+    args: Args,
+) -> List[Relationship]:
+    """
+    like get_all, but returns the full relationships as Relationship records
+    """
+    return store.get_all(table="relationships", where=_where(args), records=True)
 
 
 def delete(store: BaseAccessStore, args: Args) -> bool:
@@ -121,12 +166,7 @@ def delete(store: BaseAccessStore, args: Args) -> bool:
 
     permissive - only deletes if it exists
     """
-    return store.delete(
-        key="-".join(
-            [args.principal, args.principal_type, args.granteded, args.granted_type]
-        ),
-        table="relationships",
-    )
+    return store.delete(key=_key(args), table="relationships")
 
 
 def delete_all(store: BaseAccessStore, args: Args) -> int:
@@ -172,13 +212,8 @@ def delete_all(store: BaseAccessStore, args: Args) -> int:
             {"col": "principal_type", "val": args.principal_type},
         ]
 
-    # get all the relevant relationships
-    ships = store.get_all("relationships", where=where)
-
-    # delete them one by one
-    [store.delete(key=x["id"], table="relationships") for x in ships]
-    num_deleted = len(ships)
-    return num_deleted
+    # delete them all in one go
+    return store.delete_where(table="relationships", where=where)
 
 
 def copy(
@@ -187,30 +222,26 @@ def copy(
     from_principal_type: str,
     to_principal: str,
     to_principal_type: str,
-) -> bool:
+) -> int:
     """
     copies a relationship from the from_principal to the to_principal
     for the given types
+    relationships the to_principal already has are left as they are
+
+    returns how many relationships were copied
     """
-    # print(f'copying from {from_principal_type} {from_principal} to {to_principal_type} {to_principal}')
-    # GET ALL THE RELATIONSHIPS
-    from_relationships = store.get_all(
+    _type_check(to_principal, str, "to_principal")
+    _value_check(to_principal_type, ["group", "user"], "to_principal_type")
+    return store.copy_where(
         table="relationships",
         where=[
             {"col": "principal", "val": from_principal},
             {"col": "principal_type", "val": from_principal_type},
         ],
+        values={
+            "principal": to_principal,
+            "principal_type": to_principal_type,
+            "ts": datetime.datetime.now().isoformat(),
+        },
+        key_columns=["principal", "principal_type", "granted", "granted_type"],
     )
-
-    # SET THE NEW RELATIONSHIPS
-    for ship in from_relationships:
-        # print(f'copying from {from_principal} to {to_principal}: {ship["granted_type"]} {ship["granted_type"]}')
-        create(
-            store=store,
-            principal=to_principal,
-            principal_type=to_principal_type,
-            granted=ship["granted"],
-            granted_type=ship["granted_type"],
-        )
-
-    return True
@@ -0,0 +1,197 @@
+"""
+What-if simulation of relationship changes
+
+load the relationships once, then try proposed create/delete operations
+against them in memory and get each user's change in effective permissions;
+nothing is written to the store
+
+only the users that can reach a changed principal are resolved again,
+and group closures that the change can't reach are reused from the
+current graph, so a change to one big group only costs its members
+
+**Example**:
+from dash_access.access.simulate import Simulation
+from dash_access.access.relationship import Args
+
+sim = Simulation(store)
+changes = sim.diff([
+    ("delete", Args("mid", "group", "entry", "group")),
+    ("create", Args("mid", "group", "reports", "permission")),
+])
+# {"manager": {"added": ["reports"], "removed": ["open"]}, ...}
+"""
+
+from typing import List, Tuple
+
+# internal
+from dash_access.clients.base import BaseAccessStore
+from dash_access.access.relationship import Args
+
+OPERATIONS = ["create", "delete"]
+
+
+def _add(graph: dict, key, value):
+    graph.setdefault(key, set()).add(value)
+
+
+class Simulation(object):
+    """
+    an in-memory copy of the relationships graph to try changes against
+    the graph is loaded once; each diff() starts again from it
+    """
+
+    def __init__(self, store: BaseAccessStore):
+        ships = store.get_all(
+            "relationships",
+            columns=["principal", "principal_type", "granted", "granted_type"],
+            raw=True,
+        )
+        # principal -> the (granted, granted_type) it's granted
+        self.grants = {}
+        # granted -> the (principal, principal_type) it's granted to
+        self.granted_by = {}
+        for principal, principal_type, granted, granted_type in ships:
+            _add(self.grants, (principal, principal_type), (granted, granted_type))
+            _add(self.granted_by, (granted, granted_type), (principal, principal_type))
+        # group closures in the current graph, filled as they're needed
+        self.closures = {}
+
+    def _closure(self, start: tuple, edges, known) -> set:
+        """
+        all permissions reachable from start
+        known(group) returns a group's finished closure, or None to walk into it
+        """
+        found = set()
+        seen = {start}
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for granted, granted_type in edges(node):
+                    if granted_type == "permission":
+                        found.add(granted)
+                    elif granted_type == "group":
+                        key = (granted, "group")
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        closure = known(key)
+                        if closure is None:
+                            next_frontier.append(key)
+                        else:
+                            found |= closure
+            frontier = next_frontier
+        return found
+
+    def _edges(self, node: tuple) -> set:
+        return self.grants.get(node, set())
+
+    def _known(self, group: tuple) -> set:
+        return self.closures.get(group)
+
+    def group_closure(self, group: tuple) -> set:
+        """the group's permissions in the current graph, cached"""
+        if not group in self.closures:
+            self.closures[group] = self._closure(group, self._edges, self._known)
+        return self.closures[group]
+
+    def permissions(self, user_id: str) -> set:
+        """the user's effective permissions in the current graph"""
+        found = set()
+        for granted, granted_type in self._edges((user_id, "user")):
+            if granted_type == "permission":
+                found.add(granted)
+            elif granted_type == "group":
+                found |= self.group_closure((granted, "group"))
+        return found
+
+    def _operations(self, operations: list) -> Tuple[dict, dict]:
+        """the proposed edges to add and remove, by principal"""
+        added, removed = {}, {}
+        for operation, args in operations:
+            if not operation in OPERATIONS:
+                raise ValueError(
+                    f"Simulation: operation must be one of {', '.join(OPERATIONS)}"
+                )
+            principal = (args.principal, args.principal_type)
+            edge = (args.granted, args.granted_type)
+            if operation == "create":
+                _add(added, principal, edge)
+                removed.get(principal, set()).discard(edge)
+            else:
+                _add(removed, principal, edge)
+                added.get(principal, set()).discard(edge)
+        return added, removed
+
+    def _affected(self, changed: set, added: dict) -> set:
+        """every principal that can reach a changed principal, before or after the change"""
+        granted_by = {}
+        for principal, edges in added.items():
+            for edge in edges:
+                _add(granted_by, edge, principal)
+        affected = set(changed)
+        frontier = list(changed)
+        while frontier:
+            node = frontier.pop()
+            for principal in self.granted_by.get(node, set()) | granted_by.get(
+                node, set()
+            ):
+                if not principal in affected:
+                    affected.add(principal)
+                    frontier.append(principal)
+        return affected
+
+    def diff(self, operations: List[Tuple[str, Args]]) -> dict:
+        """
+        apply the operations to a copy of the graph and
+        return {user_id: {"added": [...], "removed": [...]}}
+        for each user whose effective permissions would change
+
+        operations are ("create" | "delete", Args) pairs;
+        a dash_access.records.Relationship works in place of Args
+        """
+        added, removed = self._operations(operations)
+        affected = self._affected(set(added) | set(removed), added)
+
+        def edges(node):
+            out = self._edges(node)
+            if node in added or node in removed:
+                out = (out - removed.get(node, set())) | added.get(node, set())
+            return out
+
+        # UNAFFECTED GROUPS KEEP THEIR CURRENT CLOSURE
+        proposed = {}
+
+        def known(group):
+            if not group in affected:
+                return self.group_closure(group)
+            return proposed.get(group)
+
+        def proposed_closure(group):
+            if not group in proposed:
+                proposed[group] = self._closure(group, edges, known)
+            return proposed[group]
+
+        out = {}
+        for node in affected:
+            user_id, principal_type = node
+            if principal_type != "user":
+                continue
+            after = set()
+            for granted, granted_type in edges(node):
+                if granted_type == "permission":
+                    after.add(granted)
+                elif granted_type == "group":
+                    key = (granted, "group")
+                    after |= proposed_closure(key) if key in affected else known(key)
+            before = self.permissions(user_id)
+            if before != after:
+                out[user_id] = dict(
+                    added=sorted(after - before), removed=sorted(before - after)
+                )
+        return out
+
+
+def simulate(store: BaseAccessStore, operations: List[Tuple[str, Args]]) -> dict:
+    """shortcut to Simulation(store).diff(operations)"""
+    return Simulation(store).diff(operations)
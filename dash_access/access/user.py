@@ -1,19 +1,30 @@
+import time
 import datetime
 from typing import List
 
 # internal
+from dash_access import metrics
+from dash_access import instrument
 from dash_access.auth import generate_password_hash
 from dash_access.access import group
-from dash_access.access.relationship import Args, create, exists, delete, get_all
-from dash_access.clients.base import BaseAccessStore
+from dash_access.access.permission import PermissionSet
+from dash_access.access.relationship import (
+    Args,
+    create,
+    create_if_not_exists,
+    exists,
+    delete,
+    get_all,
+)
+from dash_access.clients.base import BaseAccessStore, AsyncBaseAccessStore
+from dash_access.records import AccessEvent
 
 
 def add_groups(store: BaseAccessStore, user_id: str, groups: list) -> bool:
     """create user-group relationship(s)"""
     for x in groups:
         args = Args(user_id, "user", x, "group")
-        if not exists(store, args):
-            create(store, args)
+        create_if_not_exists(store, args)
     return True
 
 
@@ -56,42 +67,112 @@ def groups(store: BaseAccessStore, user_id: str) -> list:
     return list(set(this_user_groups))
 
 
+# only these are needed to walk the grants
+GRANT_COLUMNS = ["granted", "granted_type"]
+
+
+def _principal_wheres(frontier: list) -> list:
+    """one relationships where per (principal, principal_type)"""
+    return [
+        [
+            {"col": "principal", "val": principal},
+            {"col": "principal_type", "val": principal_type},
+        ]
+        for principal, principal_type in frontier
+    ]
+
+
+def _next_frontier(levels: list, found: set, seen_groups: set) -> list:
+    """
+    collect the permissions granted in this level into found
+    return the granted groups not seen yet as the next level
+    """
+    next_groups = set()
+    for ships in levels:
+        for granted, granted_type in ships:
+            if granted_type == "permission":
+                found.add(granted)
+            elif granted_type == "group":
+                if not granted in seen_groups:
+                    next_groups.add(granted)
+    seen_groups |= next_groups
+    return [(x, "group") for x in next_groups]
+
+
 def permissions(store: BaseAccessStore, user_id: str) -> list:
     """
     get all the direct and indirect user-permission relationships for this user
 
-    first, get the relationships in which a group is granted to this user
-    follow the group inheritance chain to get all the associated group-group relationships
-    then, combine the user's direct permissions with each group's granted permissions
-    return that combined list
-    """
-    user_permissions = get_all(store, Args(user_id, "user", granted_type="permission"))
-    user_groups = get_all(store, Args(user_id, "user", granted_type="group"))
-
-    already_fetched_groups = []
-    inherited_groups = user_groups.copy()
-    to_fetch = user_groups.copy()
-    while to_fetch:
-        this_inherited_group = to_fetch.pop(0)
-        if this_inherited_group in already_fetched_groups:
-            continue
-        this_granted_groups = get_all(
-            store, Args(this_inherited_group, "group", granted_type="group")
+    walk the grants level by level, starting from the user:
+    each level's principals are looked up together with one get_all_many,
+    collecting granted permissions and queueing granted groups not yet seen
+    stores that overlap or batch those lookups resolve this in one round per level
+    """
+    all_user_permissions = set()
+    seen_groups = set()
+    frontier = [(user_id, "user")]
+    while frontier:
+        levels = store.get_all_many(
+            table="relationships",
+            wheres=_principal_wheres(frontier),
+            columns=GRANT_COLUMNS,
+            raw=True,
         )
-        inherited_groups.extend(this_granted_groups)
-        already_fetched_groups.append(this_inherited_group)
-        to_fetch.extend(this_granted_groups)
-        to_fetch = list(set(to_fetch))
-
-    all_inherited_permissions = []
-    for group in list(set(inherited_groups)):
-        this_group_permissions = get_all(
-            store, Args(group, "group", granted_type="permission")
+        frontier = _next_frontier(levels, all_user_permissions, seen_groups)
+    return list(all_user_permissions)
+
+
+async def permissions_async(store: AsyncBaseAccessStore, user_id: str) -> list:
+    """async version of permissions(); each level's lookups run concurrently"""
+    all_user_permissions = set()
+    seen_groups = set()
+    frontier = [(user_id, "user")]
+    while frontier:
+        levels = await store.get_all_many(
+            table="relationships",
+            wheres=_principal_wheres(frontier),
+            columns=GRANT_COLUMNS,
+            raw=True,
         )
-        all_inherited_permissions.extend(this_group_permissions)
+        frontier = _next_frontier(levels, all_user_permissions, seen_groups)
+    return list(all_user_permissions)
+
+
+def cached_permissions(
+    store: BaseAccessStore, user_id: str, cache=None
+) -> PermissionSet:
+    """
+    the user's permissions as a PermissionSet, from the cache if it holds them
+    for the store's current generation; otherwise resolved with permissions(),
+    compiled and cached, so the wildcards are compiled once per user and generation
 
-    all_user_permissions = list(set([*user_permissions, *all_inherited_permissions]))
-    return all_user_permissions
+    cache is anything with get(key, generation) and set(key, generation, val),
+    e.g. a dash_access.access.data.ResultCache
+    """
+    if cache is None:
+        return PermissionSet(permissions(store, user_id))
+    generation = store.generation()
+    out = cache.get(str(user_id), generation)
+    metrics.cache("permissions", out is not None)
+    if out is None:
+        out = PermissionSet(permissions(store, user_id))
+        cache.set(str(user_id), generation, out)
+    return out
+
+
+async def cached_permissions_async(
+    store: AsyncBaseAccessStore, user_id: str, cache=None
+) -> PermissionSet:
+    """async version of cached_permissions(); the same cache can back both"""
+    if cache is None:
+        return PermissionSet(await permissions_async(store, user_id))
+    generation = await store.generation()
+    out = cache.get(str(user_id), generation)
+    metrics.cache("permissions", out is not None)
+    if out is None:
+        out = PermissionSet(await permissions_async(store, user_id))
+        cache.set(str(user_id), generation, out)
+    return out
 
 
 def permission_access(
@@ -111,8 +192,48 @@ def permission_access(
     return permission_insert
 
 
+async def permission_access_async(
+    store: AsyncBaseAccessStore, user_id: str, permission: str, ts: str, status: bool
+) -> bool:
+    """async version of permission_access()"""
+    return await store.insert(
+        table="access_events",
+        user_id=user_id,
+        permission=permission,
+        ts=ts,
+        status=status,
+    )
+
+
+def permission_access_many(store: BaseAccessStore, events: List[dict]) -> bool:
+    """
+    log many access attempts at once, e.g. from a batch job
+    each event is a dict or AccessEvent record of user_id, permission, ts, status
+    """
+    rows = [x._asdict() if isinstance(x, AccessEvent) else x for x in events]
+    return store.insert_many(table="access_events", rows=rows)
+
+
+def permitted(user_permissions, permission: str) -> bool:
+    """
+    does this set of resolved permissions grant the permission?
+    either directly, through "*", or through a wildcard over its
+    namespace like "reports.*" or "reports.finance.*"
+
+    pass a PermissionSet to check many permissions against the same user
+    without compiling the wildcards again
+    """
+    if not isinstance(user_permissions, PermissionSet):
+        user_permissions = PermissionSet(user_permissions)
+    return permission in user_permissions
+
+
 def has_access(
-    store: BaseAccessStore, user_id: str = None, permission: str = None
+    store: BaseAccessStore,
+    user_id: str = None,
+    permission: str = None,
+    policy=None,
+    cache=None,
 ) -> bool:
     """
     does the given user have direct or indirect relationship with the permission?
@@ -129,17 +250,33 @@ def has_access(
     first, get the permissions granted to the user
     then, get the granted to the user
     if the permission is in the user's granted permissions, they have access
+    the permissions come from the compiled policy instead, if one is given
+    and it was compiled at the store's current generation,
+    or from the permission cache, if one is given and holds them
 
     At the end, log the access attempt
     """
     if user_id is None or permission is None:
         return None
+    start = time.perf_counter()
 
     # DOES THE USER HAVE ACCESS TO THE permission?
-    user_permissions = permissions(store, user_id)
-    specific_permission = permission in user_permissions
-    all_permissions = "*" in user_permissions
-    user_has_access = specific_permission or all_permissions
+    # A STORE WITHOUT A GENERATION CAN'T SAY WHETHER THE POLICY IS STALE
+    current = (
+        policy is not None
+        and store.has_generation
+        and policy.current(store.generation())
+    )
+    if policy is not None:
+        metrics.cache("policy", current)
+    if current:
+        user_has_access = policy.permitted(user_id, permission)
+        # THE POLICY DOESN'T RESOLVE THE USER'S PERMISSIONS, SO THERE'S NO COUNT
+        n_permissions = None
+    else:
+        user_permissions = cached_permissions(store, user_id, cache)
+        user_has_access = permitted(user_permissions, permission)
+        n_permissions = len(user_permissions)
 
     # LOG permission ACCESS ATTEMPT
     permission_access(
@@ -149,6 +286,56 @@ def has_access(
         ts=datetime.datetime.now().isoformat(),
         status=user_has_access,
     )
+    instrument.access_decision(
+        user_has_access, n_permissions, time.perf_counter() - start
+    )
+    return user_has_access
+
+
+async def has_access_async(
+    store: AsyncBaseAccessStore,
+    user_id: str = None,
+    permission: str = None,
+    policy=None,
+    cache=None,
+) -> bool:
+    """
+    async version of has_access()
+    use from async Dash callbacks so permission checks and
+    access logging don't block the event loop
+    """
+    if user_id is None or permission is None:
+        return None
+    start = time.perf_counter()
+
+    # DOES THE USER HAVE ACCESS TO THE permission?
+    current = (
+        policy is not None
+        and store.has_generation
+        and policy.current(await store.generation())
+    )
+    if policy is not None:
+        metrics.cache("policy", current)
+    if current:
+        user_has_access = policy.permitted(user_id, permission)
+        # THE POLICY DOESN'T RESOLVE THE USER'S PERMISSIONS, SO THERE'S NO COUNT
+        n_permissions = None
+    else:
+        user_permissions = await cached_permissions_async(store, user_id, cache)
+        user_has_access = permitted(user_permissions, permission)
+        n_permissions = len(user_permissions)
+
+    # LOG permission ACCESS ATTEMPT
+    await permission_access_async(
+        store=store,
+        user_id=user_id,
+        permission=permission,
+        ts=datetime.datetime.now().isoformat(),
+        status=user_has_access,
+    )
+    instrument.access_decision(
+        user_has_access, n_permissions, time.perf_counter() - start
+    )
     return user_has_access
 
 
@@ -175,6 +362,27 @@ class AccessUserMixin(object):
     def store(self):
         return self.__access_store__
 
+    @property
+    def policy(self):
+        """the __access_policy__ compiled policy file if the model defines one"""
+        return getattr(self, "__access_policy__", None)
+
+    @property
+    def permission_cache(self):
+        """the __access_cache__ permission cache if the model defines one"""
+        return getattr(self, "__access_cache__", None)
+
+    @property
+    def async_store(self):
+        """
+        the __async_access_store__ if the model defines one,
+        otherwise the __access_store__ run on a thread pool
+        """
+        store = getattr(self, "__async_access_store__", None)
+        if store is None:
+            store = self.store.as_async()
+        return store
+
     def add_groups(self, groups: list) -> bool:
         return add_groups(self.store, self.id, groups)
 
@@ -200,7 +408,34 @@ class AccessUserMixin(object):
         return self.remove_permissions([permission])
 
     def has_access(self, permission: str) -> bool:
-        out = has_access(self.store, self.id, permission)
+        # CHECK THE SIGNED CLAIM FIRST, IF THE APP USES THEM
+        # imported here so the mixin doesn't need flask outside of a request
+        from dash_access.access import claims
+
+        out = claims.has_access(self, permission)
+        if out is None:
+            out = has_access(
+                self.store,
+                self.id,
+                permission,
+                policy=self.policy,
+                cache=self.permission_cache,
+            )
+        return out
+
+    async def has_access_async(self, permission: str) -> bool:
+        # THE SAME CLAIM, POLICY AND PERMISSION CACHE AS has_access
+        from dash_access.access import claims
+
+        out = await claims.has_access_async(self, permission)
+        if out is None:
+            out = await has_access_async(
+                self.async_store,
+                self.id,
+                permission,
+                policy=self.policy,
+                cache=self.permission_cache,
+            )
         return out
 
     @property
@@ -209,4 +444,4 @@ class AccessUserMixin(object):
 
     @property
     def permissions(self) -> list:
-        return permissions(self.store, self.id)
+        return list(cached_permissions(self.store, self.id, self.permission_cache))
@@ -0,0 +1,104 @@
+"""
+Permission warm-up
+
+resolve users' permissions ahead of their first check and put them in the
+permission cache, so the first page after login (or after a deploy) doesn't
+pay for walking the user's groups
+
+the cache is the user model's __access_cache__; without one there is
+nothing to warm and these do nothing
+
+**Example**:
+from dash_access.access import warmup
+from dash_access.access.data import ResultCache
+
+class User(UserMixin, db.Model, AccessUserMixin):
+    __access_store__ = PostgresAccessStore(db)
+    __access_cache__ = ResultCache(ttl=300, maxsize=10000)
+
+warmup.init_app(app.server)  # warm each user's permissions as they log in
+
+# after a deploy: warm everyone who checked access in the last day
+warmup.recent(User.__access_store__, User.__access_cache__)
+"""
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask_login import user_logged_in
+
+# internal
+from dash_access.access import user
+from dash_access.clients.base import BaseAccessStore
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int = 2) -> ThreadPoolExecutor:
+    # the pool is started on first use, not at import
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="dash_access_warmup"
+            )
+        return _executor
+
+
+def init_app(app, max_workers: int = 2):
+    """warm each user's permissions in the background when they log in"""
+    _get_executor(max_workers)
+    user_logged_in.connect(_logged_in, app)
+
+
+def _logged_in(sender, user, **kwargs):
+    warm(user)
+
+
+def warm(access_user):
+    """
+    resolve the AccessUserMixin user's permissions into their permission cache
+    on the warm-up pool; returns the Future, or None if there's no cache
+    """
+    cache = getattr(access_user, "permission_cache", None)
+    if cache is None:
+        return None
+    return _get_executor().submit(
+        user.cached_permissions, access_user.store, access_user.id, cache
+    )
+
+
+def recent_users(
+    store: BaseAccessStore, since: datetime.timedelta = datetime.timedelta(days=1)
+) -> list:
+    """
+    the users with an access attempt logged in access_events since then,
+    most recent first
+
+    SQL stores filter by ts in the query; others read access_events in chunks
+    """
+    cutoff = (datetime.datetime.now() - since).isoformat()
+    last_seen = store.last_access(cutoff)
+    return sorted(last_seen, key=last_seen.get, reverse=True)
+
+
+def recent(
+    store: BaseAccessStore,
+    cache,
+    since: datetime.timedelta = datetime.timedelta(days=1),
+    limit: int = None,
+    max_workers: int = 4,
+) -> int:
+    """
+    resolve the permissions of the users active since then into the cache,
+    e.g. right after a deploy; returns how many users were warmed
+
+    limit: only the most recently active users, e.g. the cache's maxsize
+    """
+    users = recent_users(store, since)[:limit]
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="dash_access_warmup"
+    ) as pool:
+        list(pool.map(lambda x: user.cached_permissions(store, x, cache), users))
+    return len(users)
@@ -3,21 +3,185 @@
 # rather, they are meant to be fast and secure to the computers of
 # 20 years ago. `bcrypt` uses an intentionally slow hash
 # so it is more secure.
+#
+# Because it's slow, hashing runs on a small bounded pool instead of
+# the request thread: a burst of logins queues up behind the pool
+# instead of pinning every worker thread, and is refused past the queue limit.
 
 
+import os
+import threading
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HashingBusy(RuntimeError):
+    """the hashing pool's queue is full"""
+
+
+def _hashpw(pw: str, rounds: int) -> str:
+    out = bcrypt.hashpw(bytes(pw, "utf8"), bcrypt.gensalt(rounds))
+    return out.decode("utf8")
+
+
+def _checkpw(hashed: str, pw: str) -> bool:
+    return bcrypt.checkpw(bytes(pw, "utf8"), bytes(hashed, "utf8"))
+
+
+def rounds_of(hashed: str) -> int:
+    """the cost factor a bcrypt hash was made with, e.g. 12 for $2b$12$..."""
+    return int(hashed.split("$")[2])
+
+
+class Hasher(object):
+    """
+    bcrypt on a bounded pool
+
+    rounds: the bcrypt cost factor for new hashes
+    max_workers: hashes running at once
+    max_queue: hashes waiting for a worker before new ones are refused with HashingBusy
+    processes: use a process pool instead of threads
+    timeout: seconds a sync call waits for a queue slot before giving up
+    """
+
+    def __init__(
+        self,
+        rounds: int = int(os.environ.get("DASH_ACCESS_BCRYPT_ROUNDS", 12)),
+        max_workers: int = 2,
+        max_queue: int = 32,
+        processes: bool = False,
+        timeout: float = 5,
+    ):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.processes = processes
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        # the pool is started on first use, not at import
+        with self.lock:
+            if self.executor is None:
+                if self.processes:
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self.executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="dash_access_hash",
+                    )
+            return self.executor
+
+    def submit(self, fn, *args, blocking: bool = True):
+        """run fn on the pool if there is room in the queue"""
+        if not self.slots.acquire(blocking, self.timeout if blocking else None):
+            raise HashingBusy("too many password hashes waiting; try again later")
+        try:
+            future = self.get_executor().submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda x: self.slots.release())
+        return future
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """was the hash made with a different cost factor than this hasher's?"""
+        return rounds_of(hashed) != self.rounds
+
+    # SYNC
+    def hash(self, pw: str) -> str:
+        return self.submit(_hashpw, pw, self.rounds).result()
+
+    def check(self, hashed: str, pw: str) -> bool:
+        return self.submit(_checkpw, hashed, pw).result()
+
+    def verify(self, hashed: str, pw: str) -> tuple:
+        """
+        check the password; if it's right and the hash's cost factor is outdated,
+        also hash it again with the current one
+        returns (ok, new hash or None)
+        """
+        if not self.check(hashed, pw):
+            return False, None
+        if self.needs_rehash(hashed):
+            return True, self.hash(pw)
+        return True, None
+
+    # ASYNC
+    async def _run(self, fn, *args):
+        import asyncio
+
+        # never wait for a queue slot on the event loop
+        return await asyncio.wrap_future(self.submit(fn, *args, blocking=False))
+
+    async def hash_async(self, pw: str) -> str:
+        return await self._run(_hashpw, pw, self.rounds)
+
+    async def check_async(self, hashed: str, pw: str) -> bool:
+        return await self._run(_checkpw, hashed, pw)
+
+    async def verify_async(self, hashed: str, pw: str) -> tuple:
+        """async version of verify()"""
+        if not await self.check_async(hashed, pw):
+            return False, None
+        if self.needs_rehash(hashed):
+            return True, await self.hash_async(pw)
+        return True, None
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+hasher = Hasher()
+
+
+def configure(**kwargs) -> Hasher:
+    """replace the default hasher, e.g. configure(rounds=13, max_workers=4)"""
+    global hasher
+    old = hasher
+    hasher = Hasher(**kwargs)
+    old.shutdown()
+    return hasher
 
 
 def generate_password_hash(pw: str):
     """shortcut to using bcrypt to hash a password"""
-    salt = bcrypt.gensalt()
-    pw = bytes(pw, "utf8")
-    out = bcrypt.hashpw(pw, salt)
-    return out.decode("utf8")
+    return hasher.hash(pw)
+
+
+def check_password_hash(hashed, pw, rehash=None):
+    """
+    shortcut to using bcrypt to check password
+
+    if rehash is given and the password is right but the hash's cost factor
+    is outdated, rehash is called with a new hash to store in place of the old one
+    """
+    if rehash is None:
+        return hasher.check(hashed, pw)
+    ok, new_hash = hasher.verify(hashed, pw)
+    if new_hash is not None:
+        rehash(new_hash)
+    return ok
+
+
+async def generate_password_hash_async(pw: str):
+    """async version of generate_password_hash()"""
+    return await hasher.hash_async(pw)
 
 
-def check_password_hash(hashed, pw):
-    """shortcut to using bcrypt to check password"""
-    pwbytes = bytes(pw, "utf8")
-    hashedbytes = bytes(hashed, "utf8")
-    return bcrypt.checkpw(pwbytes, hashedbytes)
+async def check_password_hash_async(hashed, pw, rehash=None):
+    """async version of check_password_hash(); rehash may be a coroutine function"""
+    if rehash is None:
+        return await hasher.check_async(hashed, pw)
+    ok, new_hash = await hasher.verify_async(hashed, pw)
+    if new_hash is not None:
+        out = rehash(new_hash)
+        if hasattr(out, "__await__"):
+            await out
+    return ok
@@ -0,0 +1,47 @@
+"""
+store backends
+
+each backend is imported only when it's first used, so importing dash_access
+doesn't pull in every database driver; third-party backends can be added
+with register() or a "dash_access.backends" entry point
+"""
+
+import importlib
+
+ENTRY_POINT_GROUP = "dash_access.backends"
+
+BACKENDS = {
+    "sqlite3": "dash_access.clients.sqlite3:Sqlite3AccessStore",
+    "sqlite3-async": "dash_access.clients.sqlite3:AsyncSqlite3AccessStore",
+    "postgres": "dash_access.clients.postgres:PostgresAccessStore",
+    "postgres-async": "dash_access.clients.postgres:AsyncPostgresAccessStore",
+    "dynamo": "dash_access.clients.dynamo:DynamoAccessStore",
+    "dynamo-async": "dash_access.clients.dynamo:AsyncDynamoAccessStore",
+    "dynamo-single-table": "dash_access.clients.dynamo:DynamoSingleTableAccessStore",
+}
+
+
+def register(name: str, target: str):
+    """register a backend by name as "module:attribute" """
+    BACKENDS[name] = target
+
+
+def load(target: str):
+    """import and return the attribute named by "module:attribute" """
+    module, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def backend(name: str):
+    """the store class registered under name, imported on first use"""
+    if not name in BACKENDS:
+        from importlib.metadata import entry_points
+
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            if ep.name == name:
+                register(name, ep.value)
+    if not name in BACKENDS:
+        raise ValueError(
+            f"backend: unknown backend {name}; one of {', '.join(BACKENDS)}"
+        )
+    return load(BACKENDS[name])
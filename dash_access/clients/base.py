@@ -1,5 +1,11 @@
 import os
+import time
 import msgpack
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from dash_access import instrument
+from dash_access.records import record_type
 
 
 class BaseAccessStore(object):
@@ -7,6 +13,9 @@ class BaseAccessStore(object):
 
     encoder = msgpack
 
+    # report operations to dash_access.instrument hooks
+    instrumented = True
+
     def teardown(self):
         # default is to do nothing
         # e.g. for dynamo, no need to do anything to close clients
@@ -21,30 +30,147 @@ class BaseAccessStore(object):
     def table_key(self):
         pass
 
-    def get(self, *args, **kwargs):
-        return self._get(*args, **kwargs)
+    @instrument.instrumented("get")
+    def get(self, key: str, table: str, records: bool = False):
+        out = self._get(key=key, table=table)
+        if records and not out in (None, []):
+            return self._record(table, out)
+        return out
 
     def _get(self):
         pass
 
-    def get_all(self, *args, **kwargs):
+    @instrument.instrumented("get_all")
+    def get_all(self, *args, records: bool = False, **kwargs):
+        """
+        records=True returns record types (see dash_access.records)
+        instead of dicts
+        """
+        if records:
+            return self._get_records(*args, **kwargs)
         return self._get_all(*args, **kwargs)
 
+    def _record(self, table: str, val: dict):
+        record = record_type(table)
+        return record._make([val.get(x) for x in record._fields])
+
+    def _get_records(self, table: str, where: list = None) -> list:
+        """
+        read the table's record fields as raw tuples and wrap them
+        relationships are all text, so their values skip decoding
+        """
+        record = record_type(table)
+        rows = self._get_all(
+            table=table, where=where, columns=list(record._fields), raw=True
+        )
+        if table == "relationships":
+            return [record._make(x) for x in rows]
+        return [record._make([self.decode(v) for v in x]) for x in rows]
+
     def _get_all(self, *args, **kwargs):
         pass
 
+    def iter_all(self, *args, **kwargs):
+        return self._iter_all(*args, **kwargs)
+
+    def _iter_all(
+        self,
+        table: str,
+        where: list = None,
+        columns: list = None,
+        chunk_size: int = 10000,
+    ):
+        """
+        yield the table's rows as raw tuples, in lists of up to chunk_size
+        stores that can read with a cursor should override this
+        """
+        rows = self.get_all(table=table, where=where, columns=columns, raw=True)
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i : i + chunk_size]
+
+    def last_access(self, since: str) -> dict:
+        return self._last_access(since)
+
+    def _last_access(self, since: str) -> dict:
+        """
+        {user_id: ts} of each user's latest access event at or after the ts since
+        reads all of access_events; stores that can filter by ts should override this
+        """
+        last_seen = {}
+        for chunk in self.iter_all("access_events", columns=["user_id", "ts"]):
+            for user_id, ts in chunk:
+                if ts >= since and ts > last_seen.get(user_id, ""):
+                    last_seen[user_id] = ts
+        return last_seen
+
+    @instrument.instrumented("get_all_many")
+    def get_all_many(self, *args, **kwargs):
+        return self._get_all_many(*args, **kwargs)
+
+    def _get_all_many(self, table: str, wheres: list, **kwargs) -> list:
+        """
+        one get_all per where, returned in the same order
+        kwargs (e.g. columns, raw) are passed to each get_all
+        stores that can batch or overlap lookups should override this
+        """
+        return [self.get_all(table=table, where=x, **kwargs) for x in wheres]
+
+    @instrument.instrumented("set")
     def set(self, *args, **kwargs):
-        return self._set(*args, **kwargs)
+        out = self._set(*args, **kwargs)
+        self._changed()
+        return out
 
     def _set(self):
         pass
 
+    @instrument.instrumented("set_if_not_exists")
+    def set_if_not_exists(self, *args, **kwargs):
+        out = self._set_if_not_exists(*args, **kwargs)
+        self._changed()
+        return out
+
+    def _set_if_not_exists(self, key: str, table: str, val: dict) -> bool:
+        """
+        set the value only if the key is not already stored
+        returns False if it was already there
+        stores that support conditional writes should override this
+        """
+        if self.get(key=key, table=table) in (None, []):
+            return self.set(key=key, table=table, val=val)
+        return False
+
+    @instrument.instrumented("set_many")
+    def set_many(self, *args, **kwargs):
+        out = self._set_many(*args, **kwargs)
+        self._changed()
+        return out
+
+    def _set_many(self, table: str, vals: list) -> bool:
+        """
+        set many records keyed by their "id"
+        stores that support bulk writes should override this
+        """
+        return all([self.set(key=x["id"], table=table, val=x) for x in vals])
+
+    @instrument.instrumented("insert")
     def insert(self, *args, **kwargs):
         return self._insert(*args, **kwargs)
 
     def _insert(self):
         pass
 
+    @instrument.instrumented("insert_many")
+    def insert_many(self, *args, **kwargs):
+        return self._insert_many(*args, **kwargs)
+
+    def _insert_many(self, table: str, rows: list) -> bool:
+        """
+        insert many rows (dicts of column names to values) into a logging table
+        stores that support bulk writes should override this
+        """
+        return all([self.insert(table, **x) for x in rows])
+
     def encode(self, val):
         return self._encode(val)
 
@@ -57,12 +183,105 @@ class BaseAccessStore(object):
     def _decode(self, val):
         return val
 
+    @instrument.instrumented("delete")
     def delete(self, *args, **kwargs):
-        return self._delete(*args, **kwargs)
+        out = self._delete(*args, **kwargs)
+        self._changed()
+        return out
 
     def _delete(self):
         pass
 
+    @instrument.instrumented("delete_where")
+    def delete_where(self, *args, **kwargs) -> int:
+        out = self._delete_where(*args, **kwargs)
+        self._changed()
+        return out
+
+    def _delete_where(self, table: str, where: list) -> int:
+        """
+        delete every record matching where; returns how many were deleted
+        stores that can delete by a where in one statement should override this
+        """
+        keys = [
+            x[0]
+            for x in self.get_all(table=table, where=where, columns=["id"], raw=True)
+        ]
+        for key in keys:
+            self.delete(key=key, table=table)
+        return len(keys)
+
+    @instrument.instrumented("copy_where")
+    def copy_where(self, *args, **kwargs) -> int:
+        out = self._copy_where(*args, **kwargs)
+        self._changed()
+        return out
+
+    def _copy_where(
+        self, table: str, where: list, values: dict, key_columns: list
+    ) -> int:
+        """
+        copy every record matching where, with the columns in values replaced
+        each copy's id is its key_columns joined by "-";
+        copies whose id already exists are skipped
+        returns how many were copied
+
+        stores that can copy with one statement should override this
+        """
+        copies = {}
+        for row in self.get_all(table=table, where=where):
+            val = {**row, **values}
+            val["id"] = "-".join([val[x] for x in key_columns])
+            copies[val["id"]] = val
+        existing = self.get_all_many(
+            table, [[{"col": "id", "val": x}] for x in copies], columns=["id"], raw=True
+        )
+        vals = [x for x, found in zip(copies.values(), existing) if not found]
+        if vals:
+            self.set_many(table, vals)
+        return len(vals)
+
+    # seconds a generation read from the store is trusted before reading it again
+    generation_ttl = 5
+
+    # does _generation() change with the relationships? stores without a change log
+    # keep it at 0, so nothing can tell when a copy of their policy is stale
+    has_generation = False
+
+    def generation(self):
+        """
+        the policy generation: a value that changes whenever relationships change
+        used to tell when cached permissions are stale
+
+        read from the store at most every generation_ttl seconds,
+        and again right after this process changes something
+        """
+        now = time.monotonic()
+        checked = getattr(self, "_generation_checked", None)
+        if checked is None or now - checked > self.generation_ttl:
+            self._generation_value = self._generation()
+            self._generation_checked = now
+        return self._generation_value
+
+    def _generation(self):
+        """
+        stores without a change log have a constant generation,
+        so cached permissions only expire with their ttl
+        """
+        return 0
+
+    def _changed(self):
+        self._generation_checked = None
+
+    def as_async(self, max_workers: int = 4):
+        """
+        an async view of this store that runs each call on a thread pool
+        the same view is returned on every call
+        """
+        if getattr(self, "_async_store", None) is None:
+            self._async_store = ThreadedAsyncAccessStore(self, max_workers=max_workers)
+        return self._async_store
+
     def table_fields(self, table: str) -> dict:
         """
         a list of all the fields that should be in the
@@ -88,3 +307,252 @@ class BaseAccessStore(object):
                 k: None for k in ["ts", "table_name", "operation", "vals", "where_val"]
             }
         return {}
+
+
+class AsyncBaseAccessStore(object):
+    """
+    async counterpart of BaseAccessStore
+    every operation is a coroutine with the same arguments and return value
+    """
+
+    encoder = msgpack
+    instrumented = True
+
+    async def teardown(self):
+        pass
+
+    def table_fields(self, table: str) -> dict:
+        return BaseAccessStore.table_fields(self, table)
+
+    @instrument.instrumented("get")
+    async def get(self, key: str, table: str, records: bool = False):
+        out = await self._get(key=key, table=table)
+        if records and not out in (None, []):
+            return self._record(table, out)
+        return out
+
+    async def _get(self):
+        pass
+
+    @instrument.instrumented("get_all")
+    async def get_all(self, *args, records: bool = False, **kwargs):
+        if records:
+            return await self._get_records(*args, **kwargs)
+        return await self._get_all(*args, **kwargs)
+
+    def _record(self, table: str, val: dict):
+        return BaseAccessStore._record(self, table, val)
+
+    async def _get_records(self, table: str, where: list = None) -> list:
+        record = record_type(table)
+        rows = await self._get_all(
+            table=table, where=where, columns=list(record._fields), raw=True
+        )
+        if table == "relationships":
+            return [record._make(x) for x in rows]
+        return [record._make([self.decode(v) for v in x]) for x in rows]
+
+    async def _get_all(self, *args, **kwargs):
+        pass
+
+    @instrument.instrumented("get_all_many")
+    async def get_all_many(self, *args, **kwargs):
+        return await self._get_all_many(*args, **kwargs)
+
+    async def _get_all_many(self, table: str, wheres: list, **kwargs) -> list:
+        """one get_all per where, run concurrently, returned in the same order"""
+        # asyncio is imported where it's used, it's always loaded by then
+        import asyncio
+
+        return list(
+            await asyncio.gather(
+                *[self.get_all(table=table, where=x, **kwargs) for x in wheres]
+            )
+        )
+
+    @instrument.instrumented("set")
+    async def set(self, *args, **kwargs):
+        out = await self._set(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _set(self):
+        pass
+
+    @instrument.instrumented("set_if_not_exists")
+    async def set_if_not_exists(self, *args, **kwargs):
+        out = await self._set_if_not_exists(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _set_if_not_exists(self, key: str, table: str, val: dict) -> bool:
+        if await self.get(key=key, table=table) in (None, []):
+            return await self.set(key=key, table=table, val=val)
+        return False
+
+    @instrument.instrumented("set_many")
+    async def set_many(self, *args, **kwargs):
+        out = await self._set_many(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _set_many(self, table: str, vals: list) -> bool:
+        return all([await self.set(key=x["id"], table=table, val=x) for x in vals])
+
+    @instrument.instrumented("insert")
+    async def insert(self, *args, **kwargs):
+        return await self._insert(*args, **kwargs)
+
+    async def _insert(self):
+        pass
+
+    @instrument.instrumented("insert_many")
+    async def insert_many(self, *args, **kwargs):
+        return await self._insert_many(*args, **kwargs)
+
+    async def _insert_many(self, table: str, rows: list) -> bool:
+        return all([await self.insert(table, **x) for x in rows])
+
+    @instrument.instrumented("delete")
+    async def delete(self, *args, **kwargs):
+        out = await self._delete(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _delete(self):
+        pass
+
+    @instrument.instrumented("delete_where")
+    async def delete_where(self, *args, **kwargs) -> int:
+        out = await self._delete_where(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _delete_where(self, table: str, where: list) -> int:
+        rows = await self.get_all(table=table, where=where, columns=["id"], raw=True)
+        for x in rows:
+            await self.delete(key=x[0], table=table)
+        return len(rows)
+
+    @instrument.instrumented("copy_where")
+    async def copy_where(self, *args, **kwargs) -> int:
+        out = await self._copy_where(*args, **kwargs)
+        self._changed()
+        return out
+
+    async def _copy_where(
+        self, table: str, where: list, values: dict, key_columns: list
+    ) -> int:
+        copies = {}
+        for row in await self.get_all(table=table, where=where):
+            val = {**row, **values}
+            val["id"] = "-".join([val[x] for x in key_columns])
+            copies[val["id"]] = val
+        existing = await self.get_all_many(
+            table, [[{"col": "id", "val": x}] for x in copies], columns=["id"], raw=True
+        )
+        vals = [x for x, found in zip(copies.values(), existing) if not found]
+        if vals:
+            await self.set_many(table, vals)
+        return len(vals)
+
+    generation_ttl = BaseAccessStore.generation_ttl
+    has_generation = False
+
+    async def generation(self):
+        """async version of BaseAccessStore.generation()"""
+        now = time.monotonic()
+        checked = getattr(self, "_generation_checked", None)
+        if checked is None or now - checked > self.generation_ttl:
+            self._generation_value = await self._generation()
+            self._generation_checked = now
+        return self._generation_value
+
+    async def _generation(self):
+        return 0
+
+    def _changed(self):
+        self._generation_checked = None
+
+    def encode(self, val):
+        return self._encode(val)
+
+    def _encode(self, val):
+        return val
+
+    def decode(self, val):
+        return self._decode(val)
+
+    def _decode(self, val):
+        return val
+
+
+class ThreadedAsyncAccessStore(AsyncBaseAccessStore):
+    """
+    async wrapper around any blocking BaseAccessStore
+
+    each call runs on a dedicated thread pool, so the event loop
+    stays free while the store blocks
+    """
+
+    # the wrapped store reports its own operations
+    instrumented = False
+
+    def __init__(self, store: BaseAccessStore, max_workers: int = 4):
+        self.store = store
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dash_access"
+        )
+
+    async def _run(self, method, *args, **kwargs):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        # RUN IN A COPY OF THE CALLER'S CONTEXT, SO HOOKS SEE ITS REQUEST
+        # (e.g. server timing) AND NESTED CALLS ARE STILL MARKED AS SUCH
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, lambda: ctx.run(method, *args, **kwargs)
+        )
+
+    async def teardown(self):
+        self.executor.shutdown(wait=False)
+        self.store.teardown()
+
+    @property
+    def has_generation(self) -> bool:
+        return self.store.has_generation
+
+    async def generation(self):
+        # THE WRAPPED STORE KEEPS ITS OWN GENERATION, AND RESETS IT ON ITS WRITES
+        return await self._run(self.store.generation)
+
+    async def _get(self, *args, **kwargs):
+        return await self._run(self.store.get, *args, **kwargs)
+
+    async def _get_all(self, *args, **kwargs):
+        return await self._run(self.store.get_all, *args, **kwargs)
+
+    async def _set(self, *args, **kwargs):
+        return await self._run(self.store.set, *args, **kwargs)
+
+    async def _set_if_not_exists(self, *args, **kwargs):
+        return await self._run(self.store.set_if_not_exists, *args, **kwargs)
+
+    async def _set_many(self, *args, **kwargs):
+        return await self._run(self.store.set_many, *args, **kwargs)
+
+    async def _insert(self, *args, **kwargs):
+        return await self._run(self.store.insert, *args, **kwargs)
+
+    async def _insert_many(self, *args, **kwargs):
+        return await self._run(self.store.insert_many, *args, **kwargs)
+
+    async def _delete(self, *args, **kwargs):
+        return await self._run(self.store.delete, *args, **kwargs)
+
+    async def _delete_where(self, *args, **kwargs):
+        return await self._run(self.store.delete_where, *args, **kwargs)
+
+    async def _copy_where(self, *args, **kwargs):
+        return await self._run(self.store.copy_where, *args, **kwargs)
@@ -1,12 +1,18 @@
 import os
+import asyncio
 import decimal
+import contextvars
+import threading
 import boto3
 from boto3.dynamodb.types import Binary
 from pynamodb.models import Model
 from pynamodb.attributes import UnicodeAttribute, BooleanAttribute, BinaryAttribute
 from pynamodb.connection import Connection
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 
-from clients.base import BaseAccessStore
+from dash_access.clients.base import BaseAccessStore, AsyncBaseAccessStore
 
 
 class Relationships(Model):
@@ -42,50 +48,391 @@ class AdminEvents(Model):
     where_val = BinaryAttribute()
 
 
+PRINCIPAL_INDEX = "principal-index"
+GRANTED_INDEX = "granted-index"
+# attributes the store writes only to feed the indexes
+INDEX_KEYS = ("principal_key", "granted_key")
+# attributes that are never returned as part of a row
+STORE_KEYS = (*INDEX_KEYS, "PK", "SK", "entity")
+
+
+def tables():
+    """
+    key schemas for each access table, as `create_table` keyword arguments
+    the table name is filled in by the store at creation time
+    """
+    return {
+        "access_events": dict(
+            KeySchema=[
+                {"AttributeName": "user_id", "KeyType": "HASH"},
+                {"AttributeName": "ts", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "user_id", "AttributeType": "S"},
+                {"AttributeName": "ts", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        ),
+        "admin_events": dict(
+            KeySchema=[{"AttributeName": "ts", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "ts", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        ),
+        "relationships": dict(
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "id", "AttributeType": "S"},
+                {"AttributeName": "principal_key", "AttributeType": "S"},
+                {"AttributeName": "granted_key", "AttributeType": "S"},
+                {"AttributeName": "granted", "AttributeType": "S"},
+                {"AttributeName": "granted_type", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    # all grants to a principal, optionally of one granted_type
+                    "IndexName": PRINCIPAL_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "principal_key", "KeyType": "HASH"},
+                        {"AttributeName": "granted_key", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    # all principals holding a granted group or permission
+                    "IndexName": GRANTED_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "granted", "KeyType": "HASH"},
+                        {"AttributeName": "granted_type", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        ),
+    }
+
+
+def principal_key(principal: str, principal_type: str) -> str:
+    """hash key of the principal index"""
+    return f"{principal}#{principal_type}"
+
+
+def granted_key(granted: str, granted_type: str) -> str:
+    """range key of the principal index"""
+    return f"{granted_type}#{granted}"
+
+
+def create_tables(resource, names: dict):
+    """
+    names maps each logical table name to the DynamoDB table name
+    """
+    for k, v in tables().items():
+        table = resource.create_table(TableName=names[k], **v)
+        table.wait_until_exists()
+        print("CREATED DYNAMODB TABLE:", k)
+    return True
+
+
+def drop_tables(resource, names: dict):
+    for k in tables():
+        table = resource.Table(names[k])
+        table.delete()
+        table.wait_until_not_exists()
+        print("DROPPED DYNAMODB TABLE:", k)
+    return True
+
+
+def _condition(where: list, key_cols: list = None):
+    """
+    translate a where list into a (key condition, filter) pair
+
+    where items on the key_cols become the key condition, the rest
+    become the filter expression; either can be None
+    """
+    if key_cols is None:
+        key_cols = []
+    key_condition = None
+    filter_expression = None
+    for x in where or []:
+        if x["col"] in key_cols:
+            cond = Key(x["col"]).eq(x["val"])
+            key_condition = cond if key_condition is None else key_condition & cond
+        else:
+            cond = Attr(x["col"]).eq(x["val"])
+            filter_expression = (
+                cond if filter_expression is None else filter_expression & cond
+            )
+    return key_condition, filter_expression
+
+
+def _conditional_check_failed(e: ClientError) -> bool:
+    """
+    did a conditional write fail its condition?
+    botocore makes the modeled exception classes per session (so per thread here),
+    so compare the error code instead of catching the class
+    """
+    return e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def index_keys(val: dict) -> dict:
+    """add the principal index keys to a relationship item"""
+    return {
+        **val,
+        "principal_key": principal_key(val["principal"], val["principal_type"]),
+        "granted_key": granted_key(val["granted"], val["granted_type"]),
+    }
+
+
+def relationships_query(where: list):
+    """
+    query arguments that answer a relationships where from an index
+    returns None if no index covers the where; the caller scans instead
+
+    principal + principal_type use the principal index, narrowed with
+    begins_with on granted_type or an exact granted_type#granted;
+    otherwise granted (+ granted_type) uses the reverse index
+    """
+    cols = {x["col"]: x["val"] for x in where or []}
+    if "principal" in cols and "principal_type" in cols:
+        used = ["principal", "principal_type"]
+        condition = Key("principal_key").eq(
+            principal_key(cols["principal"], cols["principal_type"])
+        )
+        if "granted_type" in cols and "granted" in cols:
+            used += ["granted", "granted_type"]
+            condition = condition & Key("granted_key").eq(
+                granted_key(cols["granted"], cols["granted_type"])
+            )
+        elif "granted_type" in cols:
+            used += ["granted_type"]
+            condition = condition & Key("granted_key").begins_with(
+                f"{cols['granted_type']}#"
+            )
+        index = PRINCIPAL_INDEX
+    elif "granted" in cols:
+        used = ["granted"]
+        condition = Key("granted").eq(cols["granted"])
+        if "granted_type" in cols:
+            used += ["granted_type"]
+            condition = condition & Key("granted_type").eq(cols["granted_type"])
+        index = GRANTED_INDEX
+    else:
+        return None
+
+    kwargs = dict(IndexName=index, KeyConditionExpression=condition)
+    _, filter_expression = _condition([x for x in where if not x["col"] in used])
+    if filter_expression is not None:
+        kwargs["FilterExpression"] = filter_expression
+    return kwargs
+
+
+def projection(columns: list) -> dict:
+    """
+    ProjectionExpression arguments that only read the given columns
+    names are aliased since many column names are DynamoDB reserved words
+    """
+    if not columns:
+        return {}
+    return dict(
+        ProjectionExpression=",".join([f"#p{i}" for i in range(len(columns))]),
+        ExpressionAttributeNames={f"#p{i}": x for i, x in enumerate(columns)},
+    )
+
+
+def _rows(store, table: str, items: list, columns: list = None, raw: bool = False):
+    """
+    turn DynamoDB items into get_all rows
+
+    raw returns tuples in column order without decoding or defaults;
+    otherwise dicts without the store's key attributes, with defaults filled
+    in for missing fields unless only some columns were asked for
+    """
+    if raw:
+        columns = columns or list(store.table_fields(table))
+        return [tuple([x.get(c) for c in columns]) for x in items]
+    out = [
+        {k: store.decode(v) for k, v in x.items() if not k in STORE_KEYS} for x in items
+    ]
+    if columns is None:
+        # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
+        table_fields = store.table_fields(table)
+        for o in out:
+            for field in table_fields:
+                if not field in o:
+                    o[field] = table_fields[field]
+    return out
+
+
+def get_all_request(table: str, where: list = None):
+    """
+    the (operation, kwargs) that answers a get_all on the given logical table
+    operation is "query" or "scan"
+
+    relationship lookups use an index if one covers the where;
+    otherwise a where on the table's hash key queries the table
+    and anything else is a filtered scan
+    """
+    key_cols = [x["AttributeName"] for x in tables()[table]["KeySchema"]]
+    hash_key = key_cols[0]
+    keyed = any(x["col"] == hash_key for x in where or [])
+
+    if table == "relationships" and not keyed:
+        index_query = relationships_query(where)
+        if index_query is not None:
+            return "query", index_query
+
+    key_condition, filter_expression = _condition(where, key_cols)
+    kwargs = {}
+    if filter_expression is not None:
+        kwargs["FilterExpression"] = filter_expression
+
+    if keyed:
+        return "query", dict(KeyConditionExpression=key_condition, **kwargs)
+
+    # A RANGE KEY ALONE CAN'T BE QUERIED; FILTER ON IT INSTEAD
+    if key_condition is not None:
+        kwargs["FilterExpression"] = (
+            key_condition
+            if filter_expression is None
+            else key_condition & filter_expression
+        )
+    return "scan", kwargs
+
+
 class DynamoAccessStore(BaseAccessStore):
+    """
+    DynamoDB as the backing store
+
+    segments:
+        number of parallel scan segments for unkeyed get_all calls
+        each segment is scanned on its own thread; 1 scans serially
+    max_workers:
+        number of threads used to run get_all_many lookups concurrently
+    endpoint_url:
+        optional endpoint, e.g. DynamoDB Local at http://localhost:8000
+    """
+
     def __init__(
         self,
         relationships="relationships",
         access_events="access_events",
         admin_events="admin_events",
+        segments: int = 1,
+        max_workers: int = 8,
+        endpoint_url: str = None,
     ):
-        self.c = boto3.client("dynamodb")
-        self.relationships_table = self.c.Table(relationships)
-        self.access_events_table = access_events
-        self.admin_events_table = admin_events
+        self.table_names = {
+            "relationships": relationships,
+            "access_events": access_events,
+            "admin_events": admin_events,
+        }
+        self.segments = segments
+        self.max_workers = max_workers
+        self.endpoint_url = endpoint_url
+        self._local = threading.local()
+        self._pool = None
+        self.resource = self._resource()
+
+    def _resource(self):
+        # boto3 resources are not thread-safe; each thread gets its own
+        if not hasattr(self._local, "resource"):
+            self._local.resource = boto3.session.Session().resource(
+                "dynamodb", endpoint_url=self.endpoint_url
+            )
+            self._local.tables = {}
+        return self._local.resource
 
     def get_table(self, table: str):
-        if table == "relationships":
-            return self.relationships_table
-        if table == "admin_events":
-            return self.admin_events_table
-        if table == "access_events":
-            return self.access_events_table
-        # TABLE DOESN'T EXIST
-        else:
+        if not table in self.table_names:
+            # TABLE DOESN'T EXIST
             raise ValueError(f"KeyValStore: table {table} is not available. ")
+        resource = self._resource()
+        if not table in self._local.tables:
+            self._local.tables[table] = resource.Table(self.table_names[table])
+        return self._local.tables[table]
+
+    def _paginate(self, method, **kwargs) -> list:
+        """follow LastEvaluatedKey until the scan or query is exhausted"""
+        items = []
+        while True:
+            res = method(**kwargs)
+            items.extend(res.get("Items", []))
+            if not res.get("LastEvaluatedKey"):
+                return items
+            kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+    def _scan_segment(self, table_name: str, segment: int, **kwargs) -> list:
+        table = self._resource().Table(table_name)
+        return self._paginate(
+            table.scan, Segment=segment, TotalSegments=self.segments, **kwargs
+        )
 
-    def _data(self, x: dict):
-        """pull value out of {"S":"someVal"} output structure from Dynamo"""
-        return list(x.values())[0]
-
-    def _get_all(self, table: str) -> list:
-        table_fields = self.table_fields(table)
-        table = self.get_table(table)
-
-        out = self.c.scan(table)
-        if out.get("Items"):
-            out = [
-                {key: self.decode(self._data(value)) for key, value in d.items()}
-                for d in out["Items"]
+    def _scan(self, table, **kwargs) -> list:
+        if self.segments <= 1:
+            return self._paginate(table.scan, **kwargs)
+        with ThreadPoolExecutor(max_workers=self.segments) as pool:
+            segments = pool.map(
+                lambda i: self._scan_segment(table.name, i, **kwargs),
+                range(self.segments),
+            )
+            return [item for segment in segments for item in segment]
+
+    def _get_all_many(self, table: str, wheres: list, **kwargs) -> list:
+        """
+        run one get_all per where concurrently on a thread pool
+        results are in the same order as wheres
+        """
+        if len(wheres) <= 1:
+            return [self.get_all(table=table, where=x, **kwargs) for x in wheres]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        # EACH CALL RUNS IN A COPY OF THIS CONTEXT, SO IT'S REPORTED AS NESTED
+        futures = [
+            self._pool.submit(
+                contextvars.copy_context().run,
+                self.get_all,
+                table=table,
+                where=x,
+                **kwargs,
+            )
+            for x in wheres
+        ]
+        return [x.result() for x in futures]
+
+    def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
+        """
+        get all the values from a given table
+
+        where:
+            can add a WHERE statement
+            only AND is allowed
+            [
+                {
+                    "col": string,
+                    "val": string | int | float | bool
+                }
             ]
-            # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
-            for o in out:
-                for field in table_fields:
-                    if not field in o:
-                        out[field] = table_fields[field]
-            return out
-        return []
+        columns:
+            only read these attributes (a ProjectionExpression)
+        raw:
+            return plain tuples in column order, without decoding values
+            or filling defaults
+
+        if the where covers the table's hash key this runs a query,
+        otherwise it scans (in parallel if segments > 1)
+        either way, all pages are read
+        """
+        operation, kwargs = get_all_request(table, where)
+        kwargs.update(projection(columns))
+        this_table = self.get_table(table)
+
+        if operation == "query":
+            items = self._paginate(this_table.query, **kwargs)
+        else:
+            items = self._scan(this_table, **kwargs)
+        return _rows(self, table, items, columns=columns, raw=raw)
 
     def _get(self, key: str, table: str) -> dict:
         """
@@ -110,11 +457,15 @@ class DynamoAccessStore(BaseAccessStore):
         table = self.get_table(table)
 
         # GET THE VALUE
-        val = table.get_item(key)
+        val = table.get_item(Key={"id": key})
         out = None
         if val.get("Item"):
             out = val["Item"]
-            out = {key: self.decode(self._data(value)) for key, value in out.items()}
+            out = {
+                key: self.decode(value)
+                for key, value in out.items()
+                if not key in INDEX_KEYS
+            }
 
             # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
             for field in table_fields:
@@ -137,20 +488,19 @@ class DynamoAccessStore(BaseAccessStore):
             False otherwise
         """
         # SELECT TABLE
-        table = self.get_table(table)
+        this_table = self.get_table(table)
 
         # PROCESS VALUES
         out = {key: self.encode(value) for key, value in val.items() if key != "id"}
+        if table == "relationships":
+            out = index_keys(out)
 
         # PUT THE VALUE
-        res = table.put_item(Item={"id": key, **out})
+        res = this_table.put_item(Item={"id": key, **out})
         res = res["ResponseMetadata"].get("HTTPStatusCode") == 200
 
         return res
 
-    def delete(self, key: str, table: str) -> bool:
-        return self._delete(key=key, table=table)
-
     def _delete(self, key: str, table: str) -> bool:
         # SELECT TABLE
         table = self.get_table(table)
@@ -161,8 +511,11 @@ class DynamoAccessStore(BaseAccessStore):
 
         return res
 
-    def insert(self, table: str, **kwargs):
-        return self._insert(table=table, **kwargs)
+    def create_tables(self):
+        return create_tables(self.resource, self.table_names)
+
+    def drop_tables(self):
+        return drop_tables(self.resource, self.table_names)
 
     def _insert(self, table: str, **kwargs):
         """
@@ -178,6 +531,554 @@ class DynamoAccessStore(BaseAccessStore):
         res = res["ResponseMetadata"].get("HTTPStatusCode") == 200
         return res
 
+    def _set_if_not_exists(self, key: str, table: str, val: dict) -> bool:
+        """
+        conditional put; one write instead of a get_item and a put_item
+
+        returns False if the key already exists
+        """
+        this_table = self.get_table(table)
+
+        out = {k: self.encode(value) for k, value in val.items() if k != "id"}
+        if table == "relationships":
+            out = index_keys(out)
+
+        try:
+            res = this_table.put_item(
+                Item={"id": key, **out},
+                ConditionExpression=Attr("id").not_exists(),
+            )
+        except ClientError as e:
+            if _conditional_check_failed(e):
+                return False
+            raise
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    def _set_many(self, table: str, vals: list) -> bool:
+        """
+        set many records keyed by their "id"
+
+        batch_writer sends 25-item BatchWriteItem requests and
+        resends any unprocessed items until they are all written
+        """
+        this_table = self.get_table(table)
+        with this_table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
+            for val in vals:
+                out = {k: self.encode(value) for k, value in val.items()}
+                if table == "relationships":
+                    out = index_keys(out)
+                batch.put_item(Item=out)
+        return True
+
+    def _insert_many(self, table: str, rows: list) -> bool:
+        """
+        insert many rows into a logging table with batch_writer
+        """
+        this_table = self.get_table(table)
+        with this_table.batch_writer(
+            overwrite_by_pkeys=[
+                x["AttributeName"] for x in tables()[table]["KeySchema"]
+            ]
+        ) as batch:
+            for row in rows:
+                batch.put_item(
+                    Item={key: self.encode(value) for key, value in row.items()}
+                )
+        return True
+
+
+class AsyncDynamoAccessStore(AsyncBaseAccessStore):
+    """
+    async DynamoDB store for async Dash callbacks, backed by aioboto3
+
+    uses the same tables and indexes as DynamoAccessStore;
+    the aioboto3 resource is opened on first use and closed by teardown()
+    """
+
+    def __init__(
+        self,
+        relationships="relationships",
+        access_events="access_events",
+        admin_events="admin_events",
+        segments: int = 1,
+        endpoint_url: str = None,
+    ):
+        self.table_names = {
+            "relationships": relationships,
+            "access_events": access_events,
+            "admin_events": admin_events,
+        }
+        self.segments = segments
+        self.endpoint_url = endpoint_url
+        self._context = None
+        self.resource = None
+        self.tables = {}
+
+    async def get_table(self, table: str):
+        if not table in self.table_names:
+            # TABLE DOESN'T EXIST
+            raise ValueError(f"KeyValStore: table {table} is not available. ")
+        if self.resource is None:
+            import aioboto3
+
+            self._context = aioboto3.Session().resource(
+                "dynamodb", endpoint_url=self.endpoint_url
+            )
+            self.resource = await self._context.__aenter__()
+        if not table in self.tables:
+            self.tables[table] = await self.resource.Table(self.table_names[table])
+        return self.tables[table]
+
+    async def teardown(self):
+        if self._context is not None:
+            await self._context.__aexit__(None, None, None)
+            self._context = None
+            self.resource = None
+            self.tables = {}
+
+    async def _paginate(self, method, **kwargs) -> list:
+        """follow LastEvaluatedKey until the scan or query is exhausted"""
+        items = []
+        while True:
+            res = await method(**kwargs)
+            items.extend(res.get("Items", []))
+            if not res.get("LastEvaluatedKey"):
+                return items
+            kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+    async def _scan(self, table, **kwargs) -> list:
+        if self.segments <= 1:
+            return await self._paginate(table.scan, **kwargs)
+        segments = await asyncio.gather(
+            *[
+                self._paginate(
+                    table.scan, Segment=i, TotalSegments=self.segments, **kwargs
+                )
+                for i in range(self.segments)
+            ]
+        )
+        return [item for segment in segments for item in segment]
+
+    def _strip(self, item: dict) -> dict:
+        return {k: self.decode(v) for k, v in item.items() if not k in INDEX_KEYS}
+
+    async def _get(self, key: str, table: str) -> dict:
+        table_fields = self.table_fields(table)
+        this_table = await self.get_table(table)
+        val = await this_table.get_item(Key={"id": key})
+        if not val.get("Item"):
+            return None
+        out = self._strip(val["Item"])
+
+        # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
+        for field in table_fields:
+            if not field in out:
+                out[field] = table_fields[field]
+        return out
+
+    async def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
+        """
+        same where, columns and raw handling as DynamoAccessStore._get_all:
+        indexed queries where possible, paginated (segmented) scans otherwise
+        """
+        operation, kwargs = get_all_request(table, where)
+        kwargs.update(projection(columns))
+        this_table = await self.get_table(table)
+
+        if operation == "query":
+            items = await self._paginate(this_table.query, **kwargs)
+        else:
+            items = await self._scan(this_table, **kwargs)
+        return _rows(self, table, items, columns=columns, raw=raw)
+
+    def _item(self, table: str, val: dict) -> dict:
+        out = {k: self.encode(value) for k, value in val.items()}
+        if table == "relationships":
+            out = index_keys(out)
+        return out
+
+    async def _set(self, key: str, table: str, val: dict) -> bool:
+        this_table = await self.get_table(table)
+        res = await this_table.put_item(Item=self._item(table, {**val, "id": key}))
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    async def _set_if_not_exists(self, key: str, table: str, val: dict) -> bool:
+        this_table = await self.get_table(table)
+        try:
+            res = await this_table.put_item(
+                Item=self._item(table, {**val, "id": key}),
+                ConditionExpression=Attr("id").not_exists(),
+            )
+        except ClientError as e:
+            if _conditional_check_failed(e):
+                return False
+            raise
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    async def _set_many(self, table: str, vals: list) -> bool:
+        this_table = await self.get_table(table)
+        async with this_table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
+            for val in vals:
+                await batch.put_item(Item=self._item(table, val))
+        return True
+
+    async def _delete(self, key: str, table: str) -> bool:
+        this_table = await self.get_table(table)
+        res = await this_table.delete_item(Key={"id": key})
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    async def _insert(self, table: str, **kwargs):
+        this_table = await self.get_table(table)
+        res = await this_table.put_item(Item=self._item(table, kwargs))
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    async def _insert_many(self, table: str, rows: list) -> bool:
+        this_table = await self.get_table(table)
+        async with this_table.batch_writer(
+            overwrite_by_pkeys=[
+                x["AttributeName"] for x in tables()[table]["KeySchema"]
+            ]
+        ) as batch:
+            for row in rows:
+                await batch.put_item(Item=self._item(table, row))
+        return True
+
+
+ID_INDEX = "id-index"
+INVERTED_INDEX = "inverted-index"
+
+
+def single_table():
+    """
+    key schema of the single-table adjacency-list design,
+    as `create_table` keyword arguments
+
+    items
+        relationships:  PK=P#<principal_type>#<principal>  SK=G#<granted_type>#<granted>
+        access_events:  PK=A#<user_id>                     SK=<ts>
+        admin_events:   PK=D#<date>                        SK=<ts>
+
+    the inverted index swaps PK and SK to walk grants backwards
+    the id index finds a relationship by its combo id key
+    """
+    return dict(
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+            {"AttributeName": "id", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": INVERTED_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "SK", "KeyType": "HASH"},
+                    {"AttributeName": "PK", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            {
+                "IndexName": ID_INDEX,
+                "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+            },
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+class DynamoSingleTableAccessStore(DynamoAccessStore):
+    """
+    DynamoDB as the backing store, with every access table
+    kept in one table using the adjacency-list pattern (see single_table())
+
+    one Query on a principal's partition returns all of its direct
+    grants, groups and permissions together; get_all_many runs a whole
+    frontier of those Queries concurrently, so resolving a user's
+    permissions takes one round of requests per level of inheritance
+    """
+
+    def __init__(
+        self,
+        table="access",
+        segments: int = 1,
+        max_workers: int = 8,
+        endpoint_url: str = None,
+    ):
+        super().__init__(
+            relationships=table,
+            access_events=table,
+            admin_events=table,
+            segments=segments,
+            max_workers=max_workers,
+            endpoint_url=endpoint_url,
+        )
+        self.table_name = table
+
+    def _keys(self, table: str, val: dict) -> dict:
+        """the PK and SK of an item of the given logical table"""
+        if table == "relationships":
+            return {
+                "PK": f"P#{val['principal_type']}#{val['principal']}",
+                "SK": f"G#{val['granted_type']}#{val['granted']}",
+            }
+        if table == "access_events":
+            return {"PK": f"A#{val['user_id']}", "SK": val["ts"]}
+        if table == "admin_events":
+            return {"PK": f"D#{val['ts'][:10]}", "SK": val["ts"]}
+        raise ValueError(f"KeyValStore: table {table} is not available. ")
+
+    def _item(self, table: str, val: dict) -> dict:
+        out = {k: self.encode(value) for k, value in val.items()}
+        return {**out, **self._keys(table, val), "entity": table}
+
+    def _strip(self, item: dict) -> dict:
+        return {
+            k: self.decode(v)
+            for k, v in item.items()
+            if not k in ("PK", "SK", "entity")
+        }
+
+    def _find(self, key: str, table: str) -> list:
+        """
+        the possible PK and SK of an item, worked out from its id
+
+        a relationship id is principal-principal_type-granted-granted_type
+        and the types are fixed words, so the keys come from the id itself
+        instead of the (eventually consistent) id index; there is more than
+        one candidate only if a name itself contains e.g. "-user-"
+        """
+        if table != "relationships":
+            res = self.get_table(table).query(
+                IndexName=ID_INDEX, KeyConditionExpression=Key("id").eq(key)
+            )
+            return [{"PK": x["PK"], "SK": x["SK"]} for x in res.get("Items", [])]
+        rest, _, granted_type = key.rpartition("-")
+        if not granted_type in ("group", "permission"):
+            return []
+        out = []
+        for principal_type in ("user", "group"):
+            sep = f"-{principal_type}-"
+            i = rest.find(sep)
+            while i != -1:
+                out.append(
+                    self._keys(
+                        table,
+                        dict(
+                            principal=rest[:i],
+                            principal_type=principal_type,
+                            granted=rest[i + len(sep) :],
+                            granted_type=granted_type,
+                        ),
+                    )
+                )
+                i = rest.find(sep, i + 1)
+        return out
+
+    def _get(self, key: str, table: str) -> dict:
+        table_fields = self.table_fields(table)
+        item = None
+        for keys in self._find(key, table):
+            item = (
+                self.get_table(table)
+                .get_item(Key=keys, ConsistentRead=True)
+                .get("Item")
+            )
+            if item and item.get("id") == key:
+                break
+            item = None
+        if item is None:
+            return None
+        out = self._strip(item)
+
+        # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
+        for field in table_fields:
+            if not field in out:
+                out[field] = table_fields[field]
+        return out
+
+    def _queries(self, table: str, where: list) -> list:
+        """
+        query arguments that answer the where from the table or an index
+        returns None if a scan is needed
+        """
+        cols = {x["col"]: x["val"] for x in where or []}
+        if table == "access_events" and "user_id" in cols:
+            used = ["user_id"]
+            queries = [Key("PK").eq(f"A#{cols['user_id']}")]
+            index = None
+        elif table != "relationships":
+            return None
+        elif "principal" in cols and "principal_type" in cols:
+            used = ["principal", "principal_type"]
+            condition = Key("PK").eq(f"P#{cols['principal_type']}#{cols['principal']}")
+            if "granted_type" in cols and "granted" in cols:
+                used += ["granted", "granted_type"]
+                condition = condition & Key("SK").eq(
+                    f"G#{cols['granted_type']}#{cols['granted']}"
+                )
+            elif "granted_type" in cols:
+                used += ["granted_type"]
+                condition = condition & Key("SK").begins_with(
+                    f"G#{cols['granted_type']}#"
+                )
+            else:
+                condition = condition & Key("SK").begins_with("G#")
+            queries = [condition]
+            index = None
+        elif "granted" in cols:
+            # THE INVERTED INDEX IS KEYED ON THE FULL SK, SO QUERY EACH TYPE
+            types = (
+                [cols["granted_type"]]
+                if "granted_type" in cols
+                else ["group", "permission"]
+            )
+            used = ["granted", "granted_type"]
+            queries = [
+                Key("SK").eq(f"G#{x}#{cols['granted']}") & Key("PK").begins_with("P#")
+                for x in types
+            ]
+            index = INVERTED_INDEX
+        elif "id" in cols:
+            candidates = self._find(cols["id"], table)
+            if not candidates:
+                return []
+            used = []
+            queries = [
+                Key("PK").eq(x["PK"]) & Key("SK").eq(x["SK"]) for x in candidates
+            ]
+            index = None
+        else:
+            return None
+
+        out = []
+        for condition in queries:
+            kwargs = dict(KeyConditionExpression=condition)
+            if index is not None:
+                kwargs["IndexName"] = index
+            _, filter_expression = _condition(
+                [x for x in where if not x["col"] in used]
+            )
+            if filter_expression is not None:
+                kwargs["FilterExpression"] = filter_expression
+            out.append(kwargs)
+        return out
+
+    def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
+        """
+        get all the values from a given logical table
+
+        where:
+            can add a WHERE statement
+            only AND is allowed
+            [
+                {
+                    "col": string,
+                    "val": string | int | float | bool
+                }
+            ]
+        columns:
+            only read these attributes (a ProjectionExpression)
+        raw:
+            return plain tuples in column order, without decoding values
+            or filling defaults
+
+        principal lookups query the principal's partition,
+        granted lookups query the inverted index,
+        anything else scans the table for the logical table's items
+        """
+        queries = self._queries(table, where)
+        this_table = self.get_table(table)
+
+        if queries is not None:
+            items = [
+                item
+                for kwargs in queries
+                for item in self._paginate(
+                    this_table.query, **kwargs, **projection(columns)
+                )
+            ]
+        else:
+            _, filter_expression = _condition(
+                [*(where or []), {"col": "entity", "val": table}]
+            )
+            items = self._scan(
+                this_table, FilterExpression=filter_expression, **projection(columns)
+            )
+        return _rows(self, table, items, columns=columns, raw=raw)
+
+    def _set(self, key: str, table: str, val: dict) -> bool:
+        res = self.get_table(table).put_item(Item=self._item(table, {**val, "id": key}))
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    def _set_if_not_exists(self, key: str, table: str, val: dict) -> bool:
+        try:
+            res = self.get_table(table).put_item(
+                Item=self._item(table, {**val, "id": key}),
+                ConditionExpression=Attr("PK").not_exists(),
+            )
+        except ClientError as e:
+            if _conditional_check_failed(e):
+                return False
+            raise
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    def _set_many(self, table: str, vals: list) -> bool:
+        with self.get_table(table).batch_writer(
+            overwrite_by_pkeys=["PK", "SK"]
+        ) as batch:
+            for val in vals:
+                batch.put_item(Item=self._item(table, val))
+        return True
+
+    def _delete(self, key: str, table: str) -> bool:
+        """
+        delete the item with the id
+        returns False if there was no such item to delete
+        """
+        for keys in self._find(key, table):
+            try:
+                self.get_table(table).delete_item(
+                    Key=keys, ConditionExpression=Attr("id").eq(key)
+                )
+                return True
+            except ClientError as e:
+                if not _conditional_check_failed(e):
+                    raise
+        return False
+
+    def _insert(self, table: str, **kwargs):
+        res = self.get_table(table).put_item(Item=self._item(table, kwargs))
+        return res["ResponseMetadata"].get("HTTPStatusCode") == 200
+
+    def _insert_many(self, table: str, rows: list) -> bool:
+        with self.get_table(table).batch_writer(
+            overwrite_by_pkeys=["PK", "SK"]
+        ) as batch:
+            for row in rows:
+                batch.put_item(Item=self._item(table, row))
+        return True
+
+    def create_tables(self):
+        table = self.resource.create_table(TableName=self.table_name, **single_table())
+        table.wait_until_exists()
+        print("CREATED DYNAMODB TABLE:", self.table_name)
+        return True
+
+    def drop_tables(self):
+        table = self.resource.Table(self.table_name)
+        table.delete()
+        table.wait_until_not_exists()
+        print("DROPPED DYNAMODB TABLE:", self.table_name)
+        return True
+
 
 class DynamoStore(BaseAccessStore):
     """
@@ -1,12 +1,14 @@
-from typing import Iterable
 import msgpack
-import psycopg2
 import os
 import functools
+import itertools
+import threading
+import weakref
 import datetime
 
 # internal
-from dash_access.clients.base import BaseAccessStore
+from dash_access.records import record_type
+from dash_access.clients.base import BaseAccessStore, AsyncBaseAccessStore
 
 
 def tables():
@@ -41,12 +43,60 @@ def tables():
     }
 
 
+def indexes():
+    """
+    relationships are looked up by principal when resolving a user's permissions,
+    and by granted when finding a permission's holders;
+    access events are filtered by ts when finding the recently active users
+    """
+    return {
+        "relationships_principal": """
+            create index if not exists relationships_principal
+            on relationships (principal, principal_type)
+        """,
+        "relationships_granted": """
+            create index if not exists relationships_granted
+            on relationships (granted, granted_type)
+        """,
+        "relationships_id": """
+            create index if not exists relationships_id on relationships (id)
+        """,
+        "access_events_ts": """
+            create index if not exists access_events_ts on access_events (ts)
+        """,
+    }
+
+
+def sequences():
+    """
+    admin_events_generation counts the admin events, so it only ever grows
+    it's the store's policy generation; unlike the events' ts it doesn't
+    need a scan to read or depend on the writers' clocks
+
+    it's named after the admin events table, like the store reads it
+    """
+    name = os.environ.get("ADMIN_EVENTS_TABLE", "admin_events") + "_generation"
+    return {
+        name: f"""
+            create sequence if not exists {name}
+        """,
+    }
+
+
 def create_tables(db):
     cur = db.cursor()
     for k, v in tables().items():
         cur.execute(v)
         db.commit()
         print("CREATED POSTGRES TABLE:", k)
+    for k, v in sequences().items():
+        cur.execute(v)
+        db.commit()
+        print("CREATED POSTGRES SEQUENCE:", k)
+    for k, v in indexes().items():
+        cur.execute(v)
+        db.commit()
+        print("CREATED POSTGRES INDEX:", k)
     cur.close()
     return True
 
@@ -57,10 +107,84 @@ def drop_tables(db):
         cur.execute(f"drop table if exists {t}")
         db.commit()
         print("DROPPED POSTGRES TABLE:", t)
+    for t in sequences():
+        cur.execute(f"drop sequence if exists {t}")
+        db.commit()
+        print("DROPPED POSTGRES SEQUENCE:", t)
     cur.close()
     return True
 
 
+@functools.lru_cache(maxsize=256)
+def _where(cols: tuple) -> str:
+    return (
+        " where " + " and ".join([f"{c} = ${i + 1}" for i, c in enumerate(cols)])
+        if cols
+        else ""
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _select_statement(table: str, cols: tuple = (), columns: tuple = ()) -> str:
+    return f"select {','.join(columns) or '*'} from {table}{_where(cols)}"
+
+
+@functools.lru_cache(maxsize=256)
+def _delete_statement(table: str, cols: tuple) -> str:
+    return f"delete from {table}{_where(cols)}"
+
+
+@functools.lru_cache(maxsize=256)
+def _insert_statement(table: str, cols: tuple) -> str:
+    return f"insert into {table} ({','.join(cols)}) values ({','.join([f'${i + 1}' for i in range(len(cols))])})"
+
+
+@functools.lru_cache(maxsize=256)
+def _update_statement(table: str, cols: tuple) -> str:
+    return f"update {table} set {','.join([f'{c}=${i + 1}' for i, c in enumerate(cols)])} where id=${len(cols) + 1}"
+
+
+@functools.lru_cache(maxsize=256)
+def _execute_statement(name: str, n: int) -> str:
+    return (
+        f"execute {name} ({','.join(['%s' for x in range(n)])})"
+        if n
+        else f"execute {name}"
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _copy_statement(
+    table: str, fields: tuple, cols: tuple, value_cols: tuple, key_columns: tuple
+) -> str:
+    """
+    insert a copy of each row matching cols, with value_cols replaced
+    by the v_ parameters and the id rebuilt from key_columns;
+    copies whose id already exists are skipped
+    """
+
+    def column(c):
+        return f"%(v_{c})s" if c in value_cols else f"src.{c}"
+
+    key = " || '-' || ".join([column(c) for c in key_columns])
+    select = ",".join([key if c == "id" else column(c) for c in fields])
+    where = " and ".join([f"src.{c} = %(w_{c})s" for c in cols])
+    return (
+        f"insert into {table} ({','.join(fields)}) select {select} from {table} as src "
+        f"where {where} and not exists (select 1 from {table} as dst where dst.id = {key})"
+    )
+
+
+# PREPARED STATEMENT NAMES BY CONNECTION
+# postgres keeps prepared statements per connection, so every store
+# sharing a connection has to share the names too
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+# NAMES FOR SERVER-SIDE CURSORS
+_cursors = itertools.count()
+
+
 def admin_log(func):
     """
     whenever something is added, deleted, or changed,
@@ -75,14 +199,13 @@ def admin_log(func):
     def wrapper(self, *args, **kwargs):
         table, operation, values, where, out = func(self, *args, **kwargs)
         # LOG TO ADMIN EVENTS LOG
-        table = self.get_table("admin_events")
+        admin_table = self.get_table("admin_events")
         cursor = self.db.cursor()
-        statement = f"""
-            insert into {table} (ts, table_name, operation, vals, where_val)
-            values (%s,%s,%s,%s,%s)
-        """
-        cursor.execute(
-            statement,
+        self._execute(cursor, f"select nextval('{admin_table}_generation')")
+        cols = ("ts", "table_name", "operation", "vals", "where_val")
+        self._execute(
+            cursor,
+            _insert_statement(admin_table, cols),
             (
                 datetime.datetime.now().isoformat(),
                 table,
@@ -91,12 +214,49 @@ def admin_log(func):
                 msgpack.dumps(where),
             ),
         )
+        cursor.close()
         self.db.commit()
         return out
 
     return wrapper
 
 
+def async_admin_log(func):
+    """
+    async version of admin_log
+
+    the admin event is written on the same connection and in the same
+    transaction as the change it records
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        pool = await self.get_pool()
+        async with pool.acquire() as con:
+            async with con.transaction():
+                table, operation, values, where, out = await func(
+                    self, con, *args, **kwargs
+                )
+                # LOG TO ADMIN EVENTS LOG
+                admin_table = self.get_table("admin_events")
+                await con.execute(f"select nextval('{admin_table}_generation')")
+                await con.execute(
+                    f"""
+                    insert into {admin_table}
+                        (ts, table_name, operation, vals, where_val)
+                    values ($1,$2,$3,$4,$5)
+                    """,
+                    datetime.datetime.now().isoformat(),
+                    table,
+                    operation,
+                    msgpack.dumps(values),
+                    msgpack.dumps(where),
+                )
+        return out
+
+    return wrapper
+
+
 class PostgresAccessStore(BaseAccessStore):
     """
     reference a persistent local store for development and some testing
@@ -115,6 +275,37 @@ class PostgresAccessStore(BaseAccessStore):
         print("INSTANTIATING POSTGRES ACCESS DB")
         self.db = db
 
+    def _execute(self, cur, statement: str, values: tuple = ()):
+        """
+        run the statement as a server-side prepared statement
+
+        statement uses $1, $2... placeholders; it is PREPAREd the first time
+        it's seen on this connection and run with EXECUTE afterwards,
+        so postgres skips parsing and planning on repeated calls
+        """
+        name = self._prepare(cur, statement)
+        cur.execute(_execute_statement(name, len(values)), values)
+
+    def _prepare(self, cur, statement: str) -> str:
+        """the statement's prepared name on this connection, PREPAREing it if needed"""
+        with _prepared_lock:
+            # A NEW CONNECTION HAS NOTHING PREPARED ON IT YET
+            names = _prepared.setdefault(self.db, {})
+            name = names.get(statement)
+            if name is None:
+                name = f"dash_access_{len(names)}"
+                cur.execute(f"prepare {name} as {statement}")
+                names[statement] = name
+        return name
+
+    def deallocate(self):
+        """drop this connection's prepared statements, e.g. after schema changes"""
+        with _prepared_lock:
+            cur = self.db.cursor()
+            cur.execute("deallocate all")
+            cur.close()
+            _prepared.pop(self.db, None)
+
     def get_table(self, table):
         tables = {
             "users": os.environ.get("USERS_TABLE", "users"),
@@ -161,31 +352,24 @@ class PostgresAccessStore(BaseAccessStore):
         table_fields = self.table_fields(table)
 
         cur = self.db.cursor()
-        cur.execute(
-            f"""
-            select * from {self.get_table(table)}
-            where id = %s
-        """,
-            (key,),
-        )
-        out = cur.fetchall()
+        self._execute(cur, _select_statement(self.get_table(table), ("id",)), (key,))
+        val = cur.fetchone()
+        cols = [x[0] for x in cur.description]
         cur.close()
 
-        if isinstance(out, Iterable) and len(out) == 0:
-            return []
-        if out is not None and out != [()]:
-            out = dict(out)
-            out = {k: self.decode(v) for k, v in out.items()}
+        out = None
+        if val is not None:
+            out = {k: self.decode(v) for k, v in zip(cols, val)}
 
             # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
             for field in table_fields:
                 if not field in out:
                     out[field] = table_fields[field]
-        else:
-            out = None
         return out
 
-    def _get_all(self, table: str, where: list = None) -> list:
+    def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
         """
         get all the values from a given table
 
@@ -198,40 +382,39 @@ class PostgresAccessStore(BaseAccessStore):
                     "val": string | int | float | boolean
                 }
             ]
+        columns:
+            only select these columns (default all)
+        raw:
+            return plain tuples in column order, without decoding values
+            or filling defaults; fastest for text columns like relationships
         """
         table_fields = self.table_fields(table)
 
         cur = self.db.cursor()
 
-        if not where in (None, []):
-            statement = f"""
-                select * from {self.get_table(table)}
-                where {where[0]["col"]} = %s
-            """
-            ands = " ".join([f"""and {x['col']} = %s""" for x in where[1:]])
-            statement += ands
-            inputs = tuple([x["val"] for x in where])
-            cur.execute(statement, inputs)
-            val = cur.fetchall()
-        else:
-            statement = f"""
-                select * from {self.get_table(table)}
-            """
-            cur.execute(statement)
-            val = cur.fetchall()
+        cols = tuple([x["col"] for x in where or []])
+        inputs = tuple([x["val"] for x in where or []])
+        self._execute(
+            cur,
+            _select_statement(self.get_table(table), cols, tuple(columns or ())),
+            inputs,
+        )
+        val = cur.fetchall()
+        names = [x[0] for x in cur.description]
+        cur.close()
 
+        if raw:
+            return val
         if not val or val == [()]:
             return []
-        out = [
-            {key: self.decode(value) for key, value in zip(table_fields.keys(), d)}
-            for d in val
-        ]
+        out = [{key: self.decode(value) for key, value in zip(names, d)} for d in val]
 
         # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
-        for o in out:
-            for field in table_fields:
-                if not field in o:
-                    out[field] = table_fields[field]
+        if columns is None:
+            for o in out:
+                for field in table_fields:
+                    if not field in o:
+                        o[field] = table_fields[field]
         return out
 
     @admin_log
@@ -261,33 +444,108 @@ class PostgresAccessStore(BaseAccessStore):
         cur = self.db.cursor()
 
         # IF THE RECORD EXISTS, UPDATE IT
-        cur.execute(f"select * from {this_table} where id=%s", (key,))
+        self._execute(cur, _select_statement(this_table, ("id",)), (key,))
         temp = cur.fetchone()
         if not temp in ([], None):
-            print(temp)
             # EXCLUDE id FOR UPDATES
             ID = out["id"]
             out = {k: v for k, v in out.items()}
-            statement = f"""
-                update {this_table} 
-                set {','.join([f'{col}=%s' for col in out])}
-                where id = %s
-            """
-            cur.execute(statement, tuple([*out.values(), ID]))
+            self._execute(
+                cur,
+                _update_statement(this_table, tuple(out.keys())),
+                tuple([*out.values(), ID]),
+            )
 
         # OTHERWISE INSERT THE NEW RECORD
         else:
-            statement = f"""
-                insert into {this_table}
-                ({','.join(out.keys())})
-                values ({','.join(['%s' for y in out])})
-            """
-            cur.execute(statement, tuple(out.values()))
+            self._execute(
+                cur,
+                _insert_statement(this_table, tuple(out.keys())),
+                tuple(out.values()),
+            )
         cur.close()
         ## DONE
         ###########################################################
         return this_table, "set", out, None, True
 
+    def _execute_many(self, cur, statement: str, values: list, page_size: int = 1000):
+        """
+        run the prepared statement once per values tuple,
+        sending page_size EXECUTEs per round trip
+        """
+        from psycopg2.extras import execute_batch
+
+        if not values:
+            return
+        name = self._prepare(cur, statement)
+        self._execute(cur, statement, values[0])
+        execute_batch(
+            cur,
+            _execute_statement(name, len(values[0])),
+            values[1:],
+            page_size=page_size,
+        )
+
+    @admin_log
+    def _set_many(self, table: str, vals: list) -> bool:
+        """
+        set many records keyed by their "id" in one transaction,
+        logged as a single admin event
+        """
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        # PROCESS VALUES
+        out = [{k: self.encode(value) for k, value in val.items()} for val in vals]
+
+        ###########################################################
+        ## REPLACE ANY EXISTING RECORDS AND INSERT THE BATCH
+        cur = self.db.cursor()
+        self._execute(
+            cur,
+            f"delete from {this_table} where id = any($1)",
+            ([x["id"] for x in out],),
+        )
+        for cols in {tuple(x.keys()) for x in out}:
+            self._execute_many(
+                cur,
+                _insert_statement(this_table, cols),
+                [tuple(x.values()) for x in out if tuple(x.keys()) == cols],
+            )
+        cur.close()
+        ## DONE
+        ###########################################################
+        return this_table, "set_many", out, None, True
+
+    def _iter_all(
+        self,
+        table: str,
+        where: list = None,
+        columns: list = None,
+        chunk_size: int = 10000,
+    ):
+        """
+        yield the table's rows as raw tuples, chunk_size at a time,
+        from a server-side cursor so the table is never all in memory
+        """
+        cols = [x["col"] for x in where or []]
+        statement = (
+            f"select {','.join(columns or []) or '*'} from {self.get_table(table)}"
+        )
+        if cols:
+            statement += " where " + " and ".join([f"{c} = %s" for c in cols])
+        cur = self.db.cursor(name=f"dash_access_iter_{next(_cursors)}")
+        cur.itersize = chunk_size
+        cur.execute(statement, tuple([x["val"] for x in where or []]))
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
     @admin_log
     def _delete(self, key: str, table: str, where: list = None) -> bool:
         """
@@ -309,27 +567,58 @@ class PostgresAccessStore(BaseAccessStore):
         # PUT THE VALUE
         cur = self.db.cursor()
         if not where in (None, []):
-            statement = f"""
-                delete from {self.get_table(table)}
-                where {where[0]["col"]} = %s
-            """
-            ands = " ".join([f"""and {x['col']} = %s""" for x in where])
-            statement += ands
+            cols = tuple([x["col"] for x in where])
             inputs = tuple([x["val"] for x in where])
-
-            cur.execute(statement, inputs)
+            self._execute(cur, _delete_statement(this_table, cols), inputs)
         else:
-            cur.execute(
-                f"""
-                delete from {this_table}
-                where id = %s
-            """,
-                (key,),
-            )
+            self._execute(cur, _delete_statement(this_table, ("id",)), (key,))
         cur.close()
 
         return this_table, "delete", key, where, True
 
+    @admin_log
+    def _delete_where(self, table: str, where: list) -> int:
+        """delete every record matching where in one statement"""
+        if where in (None, []):
+            raise ValueError("delete_where needs a where")
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        cur = self.db.cursor()
+        self._execute(
+            cur,
+            _delete_statement(this_table, tuple([x["col"] for x in where])),
+            tuple([x["val"] for x in where]),
+        )
+        out = cur.rowcount
+        cur.close()
+        return this_table, "delete_where", None, where, out
+
+    @admin_log
+    def _copy_where(
+        self, table: str, where: list, values: dict, key_columns: list
+    ) -> int:
+        """copy every record matching where with one INSERT ... SELECT"""
+        if where in (None, []):
+            raise ValueError("copy_where needs a where")
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        statement = _copy_statement(
+            this_table,
+            record_type(table)._fields,
+            tuple([x["col"] for x in where]),
+            tuple(values),
+            tuple(key_columns),
+        )
+        inputs = {f"v_{k}": self.encode(v) for k, v in values.items()}
+        inputs.update({f"w_{x['col']}": x["val"] for x in where})
+        cur = self.db.cursor()
+        cur.execute(statement, inputs)
+        out = cur.rowcount
+        cur.close()
+        return this_table, "copy_where", values, where, out
+
     def _insert(self, table, **kwargs):
         """
         insert values into a logging table
@@ -344,21 +633,247 @@ class PostgresAccessStore(BaseAccessStore):
 
         db = self.db
         cur = db.cursor()
-        cur.execute(
-            f"""
-                insert into {this_table} 
-                    ({ ','.join(out.keys()) })
-                values
-                    ({ ','.join(['%s' for x in out]) })
-            """,
-            tuple(out.values()),
+        self._execute(
+            cur, _insert_statement(this_table, tuple(out.keys())), tuple(out.values())
         )
         db.commit()
         cur.close()
         return True
 
+    def _last_access(self, since: str) -> dict:
+        """each user's latest access event since then, using the ts index"""
+        cur = self.db.cursor()
+        self._execute(
+            cur,
+            f"select user_id, max(ts) from {self.get_table('access_events')} "
+            "where ts >= $1 group by user_id",
+            (since,),
+        )
+        rows = cur.fetchall()
+        cur.close()
+        return dict(rows)
+
+    has_generation = True
+
+    def _generation(self):
+        """how many admin events there have been, from the admin_events_generation sequence"""
+        cur = self.db.cursor()
+        self._execute(
+            cur,
+            "select case when is_called then last_value else 0 end "
+            f"from {self.get_table('admin_events')}_generation",
+        )
+        val = cur.fetchone()
+        cur.close()
+        return val[0]
+
     def create_tables(self):
+        self.deallocate()
         return create_tables(self.db)
 
     def drop_tables(self):
+        self.deallocate()
         return drop_tables(self.db)
+
+
+class AsyncPostgresAccessStore(AsyncBaseAccessStore):
+    """
+    async postgres store for async Dash callbacks, backed by an asyncpg pool
+
+    dsn:
+        postgres connection string, e.g. postgresql://user:pw@host/db
+    min_size, max_size:
+        bounds of the connection pool; the pool is opened on first use
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def get_pool(self):
+        if self.pool is None:
+            import asyncpg
+
+            self.pool = await asyncpg.create_pool(
+                self.dsn, min_size=self.min_size, max_size=self.max_size
+            )
+        return self.pool
+
+    async def teardown(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def get_table(self, table):
+        return PostgresAccessStore.get_table(self, table)
+
+    has_generation = True
+
+    async def _generation(self):
+        """how many admin events there have been, from the admin_events_generation sequence"""
+        pool = await self.get_pool()
+        return await pool.fetchval(
+            "select case when is_called then last_value else 0 end "
+            f"from {self.get_table('admin_events')}_generation"
+        )
+
+    def _decode(self, x):
+        if isinstance(x, bytes):
+            return msgpack.loads(x)
+        return x
+
+    def _encode(self, x):
+        if isinstance(x, dict) or isinstance(x, list):
+            return msgpack.dumps(x)
+        return x
+
+    def _where(self, where: list) -> str:
+        """where list to a parameterised where clause, using $1, $2..."""
+        if where in (None, []):
+            return ""
+        return "where " + " and ".join(
+            [f"{x['col']} = ${i + 1}" for i, x in enumerate(where)]
+        )
+
+    async def _get(self, key: str, table: str) -> dict:
+        """
+        returns the full record for the key, or None if it doesn't exist
+        """
+        table_fields = self.table_fields(table)
+        pool = await self.get_pool()
+        val = await pool.fetchrow(
+            f"select * from {self.get_table(table)} where id = $1", key
+        )
+        if val is None:
+            return None
+        out = {k: self.decode(v) for k, v in dict(val).items()}
+
+        # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
+        for field in table_fields:
+            if not field in out:
+                out[field] = table_fields[field]
+        return out
+
+    async def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
+        """
+        get all the values from a given table
+
+        where:
+            can add a WHERE statement
+            only AND is allowed
+            [
+                {
+                    "col": string,
+                    "val": string | int | float | boolean
+                }
+            ]
+        columns:
+            only select these columns (default all)
+        raw:
+            return plain tuples in column order, without decoding values
+            or filling defaults; fastest for text columns like relationships
+        """
+        table_fields = self.table_fields(table)
+        pool = await self.get_pool()
+        val = await pool.fetch(
+            f"select {','.join(columns or []) or '*'} from {self.get_table(table)} {self._where(where)}",
+            *[x["val"] for x in where or []],
+        )
+        if raw:
+            return [tuple(d) for d in val]
+        out = [{k: self.decode(v) for k, v in dict(d).items()} for d in val]
+
+        # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
+        if columns is None:
+            for o in out:
+                for field in table_fields:
+                    if not field in o:
+                        o[field] = table_fields[field]
+        return out
+
+    @async_admin_log
+    async def _set(self, con, key: str, table: str, val: dict) -> bool:
+        """
+        insert or update the record for the key
+        returns True if val successfully stored
+        """
+        this_table = self.get_table(table)
+        out = {k: self.encode(value) for k, value in val.items()}
+
+        # IF THE RECORD EXISTS, UPDATE IT
+        if await con.fetchrow(f"select id from {this_table} where id = $1", key):
+            cols = ",".join([f"{col}=${i + 1}" for i, col in enumerate(out)])
+            await con.execute(
+                f"update {this_table} set {cols} where id = ${len(out) + 1}",
+                *out.values(),
+                key,
+            )
+
+        # OTHERWISE INSERT THE NEW RECORD
+        else:
+            await con.execute(
+                f"""
+                insert into {this_table} ({','.join(out.keys())})
+                values ({','.join([f'${i + 1}' for i in range(len(out))])})
+                """,
+                *out.values(),
+            )
+        return this_table, "set", out, None, True
+
+    @async_admin_log
+    async def _delete(self, con, key: str, table: str, where: list = None) -> bool:
+        """
+        delete from the table by key, or by where if given
+        """
+        this_table = self.get_table(table)
+        if not where in (None, []):
+            await con.execute(
+                f"delete from {this_table} {self._where(where)}",
+                *[x["val"] for x in where],
+            )
+        else:
+            await con.execute(f"delete from {this_table} where id = $1", key)
+        return this_table, "delete", key, where, True
+
+    async def _insert(self, table, **kwargs):
+        """
+        insert values into a logging table
+        kwargs is column names mapped to values
+        """
+        this_table = self.get_table(table)
+        out = {key: self.encode(value) for key, value in kwargs.items()}
+        pool = await self.get_pool()
+        await pool.execute(
+            f"""
+            insert into {this_table} ({','.join(out.keys())})
+            values ({','.join([f'${i + 1}' for i in range(len(out))])})
+            """,
+            *out.values(),
+        )
+        return True
+
+    async def _insert_many(self, table: str, rows: list) -> bool:
+        """
+        insert many rows with one executemany per distinct set of columns
+        """
+        this_table = self.get_table(table)
+        pool = await self.get_pool()
+        by_cols = {}
+        for row in rows:
+            by_cols.setdefault(tuple(row.keys()), []).append(
+                tuple([self.encode(v) for v in row.values()])
+            )
+        async with pool.acquire() as con:
+            for cols, vals in by_cols.items():
+                await con.executemany(
+                    f"""
+                    insert into {this_table} ({','.join(cols)})
+                    values ({','.join([f'${i + 1}' for i in range(len(cols))])})
+                    """,
+                    vals,
+                )
+        return True
@@ -3,11 +3,13 @@ import functools
 import msgpack
 import sqlite3
 import os
+import sys
 import decimal
-from boto3.dynamodb.types import Binary
+import threading
 import datetime
 
-from dash_access.clients.base import BaseAccessStore
+from dash_access.records import record_type
+from dash_access.clients.base import BaseAccessStore, ThreadedAsyncAccessStore
 
 
 def tables():
@@ -40,12 +42,46 @@ def tables():
     }
 
 
+def _is_binary(value) -> bool:
+    """is this a boto3 Binary? it can only be one if boto3 was already imported"""
+    types = sys.modules.get("boto3.dynamodb.types")
+    return types is not None and isinstance(value, types.Binary)
+
+
+def indexes():
+    """
+    relationships are looked up by principal when resolving a user's permissions,
+    and by granted when finding a permission's holders;
+    access events are filtered by ts when finding the recently active users
+    """
+    return {
+        "relationships_principal": """
+            create index if not exists relationships_principal
+            on relationships (principal, principal_type)
+        """,
+        "relationships_granted": """
+            create index if not exists relationships_granted
+            on relationships (granted, granted_type)
+        """,
+        "relationships_id": """
+            create index if not exists relationships_id on relationships (id)
+        """,
+        "access_events_ts": """
+            create index if not exists access_events_ts on access_events (ts)
+        """,
+    }
+
+
 def create_tables(db):
     cur = db.cursor()
     for k, v in tables().items():
         cur.execute(v)
         db.commit()
         print("CREATED SQLITE3 TABLE:", k)
+    for k, v in indexes().items():
+        cur.execute(v)
+        db.commit()
+        print("CREATED SQLITE3 INDEX:", k)
     cur.close()
     return True
 
@@ -60,6 +96,57 @@ def drop_tables(db):
     return True
 
 
+@functools.lru_cache(maxsize=256)
+def _where(cols: tuple) -> str:
+    return " where " + " and ".join([f"{c} = ?" for c in cols]) if cols else ""
+
+
+@functools.lru_cache(maxsize=256)
+def _select_statement(table: str, cols: tuple = (), columns: tuple = ()) -> str:
+    """
+    statements are built once per (table, where columns, selected columns) shape
+    and sent as the same string, so sqlite's statement cache can reuse them
+    """
+    return f"select {','.join(columns) or '*'} from {table}{_where(cols)}"
+
+
+@functools.lru_cache(maxsize=256)
+def _delete_statement(table: str, cols: tuple) -> str:
+    return f"delete from {table}{_where(cols)}"
+
+
+@functools.lru_cache(maxsize=256)
+def _insert_statement(table: str, cols: tuple) -> str:
+    return f"insert into {table} ({','.join(cols)}) values ({','.join(['?' for x in cols])})"
+
+
+@functools.lru_cache(maxsize=256)
+def _update_statement(table: str, cols: tuple) -> str:
+    return f"update {table} set {','.join([f'{c}=?' for c in cols])} where id=?"
+
+
+@functools.lru_cache(maxsize=256)
+def _copy_statement(
+    table: str, fields: tuple, cols: tuple, value_cols: tuple, key_columns: tuple
+) -> str:
+    """
+    insert a copy of each row matching cols, with value_cols replaced
+    by the v_ parameters and the id rebuilt from key_columns;
+    copies whose id already exists are skipped
+    """
+
+    def column(c):
+        return f":v_{c}" if c in value_cols else f"src.{c}"
+
+    key = " || '-' || ".join([column(c) for c in key_columns])
+    select = ",".join([key if c == "id" else column(c) for c in fields])
+    where = " and ".join([f"src.{c} = :w_{c}" for c in cols])
+    return (
+        f"insert into {table} ({','.join(fields)}) select {select} from {table} as src "
+        f"where {where} and not exists (select 1 from {table} as dst where dst.id = {key})"
+    )
+
+
 def admin_log(func):
     """
     whenever something is added, deleted, or changed,
@@ -74,15 +161,13 @@ def admin_log(func):
     def wrapper(self, *args, **kwargs):
         table, operation, values, where, out = func(self, *args, **kwargs)
         # LOG TO ADMIN EVENTS LOG
-        table = self.get_table("admin_events")
+        admin_table = self.get_table("admin_events")
         with self.get_db() as db:
             cursor = db.cursor()
-            statement = f"""
-                insert into {table} (ts, table_name, operation, vals, where_val)
-                values (?,?,?,?,?)
-            """
             cursor.execute(
-                statement,
+                _insert_statement(
+                    admin_table, ("ts", "table_name", "operation", "vals", "where_val")
+                ),
                 (
                     datetime.datetime.now().isoformat(),
                     table,
@@ -122,30 +207,36 @@ class Sqlite3AccessStore(BaseAccessStore):
                 ...
     """
 
-    def __init__(self, path: str = "local.db"):
-        self.instantiate(path)
+    def __init__(self, path: str = "local.db", cached_statements: int = 128):
+        self.instantiate(path, cached_statements)
 
     def get_db(self):
         return self.db
 
     @property
     def db(self):
-        # can't share connections between threads - new connection for each transaction
-        # fix this by using custom logic to share connectinos between threads with flask.g
+        # can't share connections between threads - one connection per thread (and process)
+        # reusing the connection keeps its statement cache, so the fixed query
+        # shapes below are only compiled once per thread
         # this isn't normal as you should use a production database with SqlAlchemy or DynamoDB, not Sqlite.
         # Only should only be used for dev.
-        con = sqlite3.connect(self.path)
-        con.row_factory = sqlite3.Row  # return values as dicts
-        cur = con.cursor()
-        cur.execute("PRAGMA journal_mode = WAL")
-        cur.execute("PRAGMA synchronous = NORMAL")
-        con.commit()
-        cur.close()
-        return con
+        if getattr(self._local, "pid", None) != os.getpid():
+            con = sqlite3.connect(self.path, cached_statements=self.cached_statements)
+            con.row_factory = sqlite3.Row  # return values as dicts
+            cur = con.cursor()
+            cur.execute("PRAGMA journal_mode = WAL")
+            cur.execute("PRAGMA synchronous = NORMAL")
+            con.commit()
+            cur.close()
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return self._local.con
 
-    def instantiate(self, path: str = "local.db"):
+    def instantiate(self, path: str = "local.db", cached_statements: int = 128):
         """instantiate with sqlite3 as the backing store"""
         self.path = path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
 
     def get_table(self, table):
         tables = {
@@ -194,8 +285,9 @@ class Sqlite3AccessStore(BaseAccessStore):
 
         cur = self.db.cursor()
         val = cur.execute(
-            f"""select * from {self.get_table(table)} where id=?""", (key,)
+            _select_statement(self.get_table(table), ("id",)), (key,)
         ).fetchone()
+        cur.close()
 
         out = val
         if val is not None:
@@ -209,7 +301,9 @@ class Sqlite3AccessStore(BaseAccessStore):
 
         return out
 
-    def _get_all(self, table: str, where: list = None) -> list:
+    def _get_all(
+        self, table: str, where: list = None, columns: list = None, raw: bool = False
+    ) -> list:
         """
         get all the values from a given table
 
@@ -222,32 +316,36 @@ class Sqlite3AccessStore(BaseAccessStore):
                     "val": string | int | float | bool
                 }
             ]
+        columns:
+            only select these columns (default all)
+        raw:
+            return plain tuples in column order, without decoding values
+            or filling defaults; fastest for text columns like relationships
         """
         table_fields = self.table_fields(table)
         cur = self.db.cursor()
+        if raw:
+            cur.row_factory = None
 
-        if not where in (None, []):
-            statement = (
-                f"""select * from {self.get_table(table)} where {where[0]["col"]} = ?"""
-            )
-            ands = " ".join([f"""and {x['col']} = ?""" for x in where[1:]])
-            statement += ands
-            inputs = tuple([x["val"] for x in where])
-            val = cur.execute(statement, inputs).fetchall()
-        else:
-            statement = f"""
-                select * from {self.get_table(table)}
-            """
-            val = cur.execute(statement).fetchall()
+        cols = tuple([x["col"] for x in where or []])
+        inputs = tuple([x["val"] for x in where or []])
+        val = cur.execute(
+            _select_statement(self.get_table(table), cols, tuple(columns or ())),
+            inputs,
+        ).fetchall()
+        cur.close()
+        if raw:
+            return val
         if not val:
             return []
         out = [{key: self.decode(value) for key, value in dict(d).items()} for d in val]
 
         # ADD DEFAULT FIELD VALUES FOR MISSING FIELDS
-        for o in out:
-            for field in table_fields:
-                if not field in o:
-                    out[field] = table_fields[field]
+        if columns is None:
+            for o in out:
+                for field in table_fields:
+                    if not field in o:
+                        o[field] = table_fields[field]
         return out
 
     @admin_log
@@ -281,23 +379,88 @@ class Sqlite3AccessStore(BaseAccessStore):
             cur = db.cursor()
 
             # IF THE RECORD EXISTS, UPDATE IT
-            if cur.execute(f"select * from {this_table} where id=?", (key,)).fetchone():
+            if cur.execute(_select_statement(this_table, ("id",)), (key,)).fetchone():
                 # EXCLUDE id FOR UPDATES
                 ID = out["id"]
                 out = {k: v for k, v in out.items()}
-                statement = f"""update {this_table} set {','.join([f'{col}=?' for col in out])} where id=?"""
-                cur.execute(statement, tuple([*out.values(), ID]))
+                cur.execute(
+                    _update_statement(this_table, tuple(out.keys())),
+                    tuple([*out.values(), ID]),
+                )
 
             # OTHERWISE INSERT THE NEW RECORD
             else:
-                statement = f"""insert into {this_table} ({','.join(out.keys())}) values ({','.join(['?' for y in out])})"""
-                cur.execute(statement, tuple(out.values()))
+                cur.execute(
+                    _insert_statement(this_table, tuple(out.keys())),
+                    tuple(out.values()),
+                )
             db.commit()
             cur.close()
         ## DONE
         ###########################################################
         return this_table, "set", out, None, True
 
+    @admin_log
+    def _set_many(self, table: str, vals: list) -> bool:
+        """
+        set many records keyed by their "id" in one transaction,
+        logged as a single admin event
+        """
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        # PROCESS VALUES - NO DYNAMO TYPES
+        out = [
+            {
+                key: (float(value) if isinstance(value, decimal.Decimal) else value)
+                for key, value in ((k, self.encode(v)) for k, v in val.items())
+            }
+            for val in vals
+        ]
+
+        ###########################################################
+        ## REPLACE ANY EXISTING RECORDS AND INSERT THE BATCH
+        with self.get_db() as db:
+            cur = db.cursor()
+            cur.executemany(
+                _delete_statement(this_table, ("id",)), [(x["id"],) for x in out]
+            )
+            for cols in {tuple(x.keys()) for x in out}:
+                cur.executemany(
+                    _insert_statement(this_table, cols),
+                    [tuple(x.values()) for x in out if tuple(x.keys()) == cols],
+                )
+            db.commit()
+            cur.close()
+        ## DONE
+        ###########################################################
+        return this_table, "set_many", out, None, True
+
+    def _iter_all(
+        self,
+        table: str,
+        where: list = None,
+        columns: list = None,
+        chunk_size: int = 10000,
+    ):
+        """yield the table's rows as raw tuples, fetched chunk_size at a time"""
+        cur = self.db.cursor()
+        cur.row_factory = None
+        cols = tuple([x["col"] for x in where or []])
+        inputs = tuple([x["val"] for x in where or []])
+        cur.execute(
+            _select_statement(self.get_table(table), cols, tuple(columns or ())),
+            inputs,
+        )
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
     @admin_log
     def _delete(self, key: str, table: str, where: list = None) -> bool:
         """
@@ -321,18 +484,62 @@ class Sqlite3AccessStore(BaseAccessStore):
         with self.get_db() as db:
             cur = db.cursor()
             if not where in (None, []):
-                statement = f"""delete from {self.get_table(table)} where {where[0]["col"]} = ?"""
-                ands = " ".join([f"""and {x['col']} = ?""" for x in where])
-                statement += ands
+                cols = tuple([x["col"] for x in where])
                 inputs = tuple([x["val"] for x in where])
-                cur.execute(statement, inputs)
+                cur.execute(_delete_statement(this_table, cols), inputs)
             else:
-                cur.execute(f"""delete from {this_table} where id=?""", (key,))
+                cur.execute(_delete_statement(this_table, ("id",)), (key,))
             cur.close()
             db.commit()
 
         return this_table, "delete", key, where, True
 
+    @admin_log
+    def _delete_where(self, table: str, where: list) -> int:
+        """delete every record matching where in one statement"""
+        if where in (None, []):
+            raise ValueError("delete_where needs a where")
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        with self.get_db() as db:
+            cur = db.cursor()
+            cur.execute(
+                _delete_statement(this_table, tuple([x["col"] for x in where])),
+                tuple([x["val"] for x in where]),
+            )
+            out = cur.rowcount
+            cur.close()
+            db.commit()
+        return this_table, "delete_where", None, where, out
+
+    @admin_log
+    def _copy_where(
+        self, table: str, where: list, values: dict, key_columns: list
+    ) -> int:
+        """copy every record matching where with one INSERT ... SELECT"""
+        if where in (None, []):
+            raise ValueError("copy_where needs a where")
+        # SELECT TABLE
+        this_table = self.get_table(table)
+
+        statement = _copy_statement(
+            this_table,
+            record_type(table)._fields,
+            tuple([x["col"] for x in where]),
+            tuple(values),
+            tuple(key_columns),
+        )
+        inputs = {f"v_{k}": self.encode(v) for k, v in values.items()}
+        inputs.update({f"w_{x['col']}": x["val"] for x in where})
+        with self.get_db() as db:
+            cur = db.cursor()
+            cur.execute(statement, inputs)
+            out = cur.rowcount
+            cur.close()
+            db.commit()
+        return this_table, "copy_where", values, where, out
+
     def _insert(self, table, **kwargs):
         """
         insert values into a logging table
@@ -349,22 +556,60 @@ class Sqlite3AccessStore(BaseAccessStore):
             for key, value in out.items()
         }
         out = {
-            key: (value.value if isinstance(value, Binary) else value)
+            key: (value.value if _is_binary(value) else value)
             for key, value in out.items()
         }
 
         with self.get_db() as db:
             cur = db.cursor()
             cur.execute(
-                f"""insert into {this_table} ({ ','.join(out.keys()) }) values ({ ','.join(['?' for x in out]) })""",
-                tuple(out.values()),
+                _insert_statement(this_table, tuple(out.keys())), tuple(out.values())
             )
             cur.close()
             db.commit()
         return True
 
+    def _last_access(self, since: str) -> dict:
+        """each user's latest access event since then, using the ts index"""
+        cur = self.db.cursor()
+        cur.row_factory = None
+        rows = cur.execute(
+            f"select user_id, max(ts) from {self.get_table('access_events')} "
+            "where ts >= ? group by user_id",
+            (since,),
+        ).fetchall()
+        cur.close()
+        return dict(rows)
+
+    has_generation = True
+
+    def _generation(self):
+        """
+        the rowid of the latest admin event
+        it only grows, and reading it doesn't scan the table or depend on clocks
+        """
+        cur = self.db.cursor()
+        cur.row_factory = None
+        val = cur.execute(
+            f"select max(rowid) from {self.get_table('admin_events')}"
+        ).fetchone()
+        cur.close()
+        return val[0] or 0
+
     def create_tables(self):
         return create_tables(self.db)
 
     def drop_tables(self):
         return drop_tables(self.db)
+
+
+class AsyncSqlite3AccessStore(ThreadedAsyncAccessStore):
+    """
+    async sqlite3 store for async Dash callbacks
+
+    sqlite3 has no async driver in the standard library, so every call
+    runs the blocking Sqlite3AccessStore on a dedicated thread pool
+    """
+
+    def __init__(self, path: str = "local.db", max_workers: int = 4):
+        super().__init__(Sqlite3AccessStore(path), max_workers=max_workers)
@@ -0,0 +1,232 @@
+"""
+Hooks around store operations
+
+every public store operation (get, get_all, get_all_many, set,
+set_if_not_exists, set_many, insert, insert_many, delete) reports a StoreCall
+to each registered hook once it finishes, and every access decision is
+reported to the access hooks; with no hooks registered,
+the only cost is one check of an empty list
+
+**Example**:
+from dash_access import instrument
+
+def log_call(call):
+    print(call.operation, call.table, call.rows, call.seconds)
+
+instrument.add_hook(log_call)
+"""
+
+import time
+import functools
+import inspect
+from contextvars import ContextVar
+from typing import NamedTuple
+
+hooks = []
+
+# called after every access decision: has_access, signed claims and ControlledScope checks
+access_hooks = []
+
+# how many instrumented operations are running in this context
+_depth = ContextVar("dash_access_instrument_depth", default=0)
+
+# where each operation takes its table argument, by position
+TABLE_ARG = {
+    "get": 1,
+    "get_all": 0,
+    "get_all_many": 0,
+    "set": 1,
+    "set_if_not_exists": 1,
+    "set_many": 0,
+    "insert": 0,
+    "insert_many": 0,
+    "delete": 1,
+    "delete_where": 0,
+    "copy_where": 0,
+}
+
+# where the many-operations take their list of values, by position
+MANY_ARG = {
+    "get_all_many": ("wheres", 1),
+    "set_many": ("vals", 1),
+    "insert_many": ("rows", 1),
+}
+
+
+class StoreCall(NamedTuple):
+    """one finished store operation"""
+
+    # the store the operation ran on
+    store: object
+    # e.g. "get_all"
+    operation: str
+    table: str
+    # the where list(s) passed to get_all or get_all_many, if any
+    where: list
+    # rows read, or rows written
+    rows: int
+    # wall time in seconds
+    seconds: float
+    # when the operation started, as time.time_ns()
+    start_ns: int
+    # True if it ran inside another instrumented operation,
+    # e.g. the get_all calls made by the default get_all_many
+    nested: bool
+    # the exception it raised, if any
+    error: BaseException
+
+    @property
+    def where_columns(self) -> list:
+        """the columns the where list(s) filtered on"""
+        if not self.where:
+            return []
+        wheres = self.where if isinstance(self.where[0], list) else [self.where]
+        return sorted({x["col"] for where in wheres for x in where})
+
+
+def access_decision(allowed: bool, permissions: int, seconds: float):
+    """
+    report an access decision, how many permissions the user has and its time
+    permissions is None when the decision didn't resolve them, e.g. a compiled policy
+    """
+    if access_hooks:
+        for hook in list(access_hooks):
+            hook(allowed, permissions, seconds)
+
+
+def add_access_hook(hook):
+    """call hook(allowed, permissions, seconds) after every access decision"""
+    if not hook in access_hooks:
+        access_hooks.append(hook)
+    return hook
+
+
+def remove_access_hook(hook):
+    if hook in access_hooks:
+        access_hooks.remove(hook)
+
+
+def add_hook(hook):
+    """call hook(call: StoreCall) after every store operation"""
+    if not hook in hooks:
+        hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+
+def _arg(args, kwargs, name: str, position: int):
+    if name in kwargs:
+        return kwargs[name]
+    if len(args) > position:
+        return args[position]
+    return None
+
+
+def _rows(operation: str, args, kwargs, out) -> int:
+    if operation == "get":
+        return 0 if out in (None, []) else 1
+    if operation == "get_all":
+        return len(out) if out else 0
+    if operation == "get_all_many":
+        return sum(len(x) for x in out) if out else 0
+    if operation in ("delete_where", "copy_where"):
+        # these return how many records they deleted or copied
+        return out or 0
+    if operation in MANY_ARG:
+        return len(_arg(args, kwargs, *MANY_ARG[operation]) or [])
+    return 1
+
+
+def _report(store, operation, args, kwargs, out, start, start_ns, nested, error):
+    seconds = time.perf_counter() - start
+    where = None
+    if operation in ("get_all", "delete_where", "copy_where"):
+        where = _arg(args, kwargs, "where", 1)
+    elif operation == "get_all_many":
+        where = _arg(args, kwargs, "wheres", 1)
+    call = StoreCall(
+        store=store,
+        operation=operation,
+        table=_arg(args, kwargs, "table", TABLE_ARG[operation]),
+        where=where,
+        rows=0 if error is not None else _rows(operation, args, kwargs, out),
+        seconds=seconds,
+        start_ns=start_ns,
+        nested=nested,
+        error=error,
+    )
+    for hook in list(hooks):
+        hook(call)
+
+
+def instrumented(operation: str):
+    """report each call of the decorated store operation to the hooks"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                if not hooks or not self.instrumented:
+                    return await func(self, *args, **kwargs)
+                depth = _depth.get()
+                token = _depth.set(depth + 1)
+                start_ns, start = time.time_ns(), time.perf_counter()
+                out, error = None, None
+                try:
+                    out = await func(self, *args, **kwargs)
+                    return out
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    _depth.reset(token)
+                    _report(
+                        self,
+                        operation,
+                        args,
+                        kwargs,
+                        out,
+                        start,
+                        start_ns,
+                        depth > 0,
+                        error,
+                    )
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not hooks or not self.instrumented:
+                return func(self, *args, **kwargs)
+            depth = _depth.get()
+            token = _depth.set(depth + 1)
+            start_ns, start = time.time_ns(), time.perf_counter()
+            out, error = None, None
+            try:
+                out = func(self, *args, **kwargs)
+                return out
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _depth.reset(token)
+                _report(
+                    self,
+                    operation,
+                    args,
+                    kwargs,
+                    out,
+                    start,
+                    start_ns,
+                    depth > 0,
+                    error,
+                )
+
+        return wrapper
+
+    return decorator
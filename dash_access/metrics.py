@@ -0,0 +1,222 @@
+"""
+Metrics for store operations, access checks and caches
+
+metrics go to a pluggable sink; with no sink set (the default)
+nothing is measured. PrometheusSink keeps them in memory and renders
+the Prometheus text format, served by blueprint() from the Flask app.
+
+**Example**:
+from dash_access import metrics
+
+sink = metrics.set_sink(metrics.PrometheusSink())
+app.server.register_blueprint(metrics.blueprint(sink))
+
+Metrics:
+    dash_access_store_operations_total      counter     operation, table, status
+    dash_access_store_operation_seconds     histogram   operation, table
+    dash_access_store_rows                  histogram   operation, table
+    dash_access_has_access_total            counter     decision
+    dash_access_has_access_seconds          histogram
+    dash_access_permissions                 histogram   (resolved permissions per check)
+    dash_access_cache_total                 counter     cache, result
+"""
+
+import threading
+
+# internal
+from dash_access import instrument
+
+sink = None
+
+SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+
+class MetricsSink(object):
+    """receives metrics; subclass it to send them elsewhere, e.g. statsd"""
+
+    def increment(self, name: str, value: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+
+def set_sink(new_sink: MetricsSink) -> MetricsSink:
+    """send metrics to new_sink; None turns metrics off"""
+    global sink
+    sink = new_sink
+    if sink is None:
+        instrument.remove_hook(_store_hook)
+        instrument.remove_access_hook(_access_hook)
+    else:
+        instrument.add_hook(_store_hook)
+        instrument.add_access_hook(_access_hook)
+    return sink
+
+
+def increment(name: str, value: float = 1, **labels):
+    if sink is not None:
+        sink.increment(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    if sink is not None:
+        sink.observe(name, value, **labels)
+
+
+def cache(name: str, hit: bool):
+    """count a cache hit or miss"""
+    if sink is not None:
+        sink.increment(
+            "dash_access_cache_total", cache=name, result="hit" if hit else "miss"
+        )
+
+
+def _access_hook(allowed: bool, permissions: int, seconds: float):
+    out = sink
+    if out is None:
+        return
+    out.increment(
+        "dash_access_has_access_total", decision="allow" if allowed else "deny"
+    )
+    out.observe("dash_access_has_access_seconds", seconds)
+    if permissions is not None:
+        out.observe("dash_access_permissions", permissions)
+
+
+def _store_hook(call: instrument.StoreCall):
+    out = sink
+    # nested operations are already counted by the one that made them
+    if out is None or call.nested:
+        return
+    out.increment(
+        "dash_access_store_operations_total",
+        operation=call.operation,
+        table=call.table,
+        status="ok" if call.error is None else "error",
+    )
+    out.observe(
+        "dash_access_store_operation_seconds",
+        call.seconds,
+        operation=call.operation,
+        table=call.table,
+    )
+    out.observe(
+        "dash_access_store_rows", call.rows, operation=call.operation, table=call.table
+    )
+
+
+class PrometheusSink(MetricsSink):
+    """
+    in-memory counters and histograms, rendered in the Prometheus text format
+
+    histograms named *_seconds use SECONDS_BUCKETS, the rest COUNT_BUCKETS
+    """
+
+    def __init__(self, buckets: dict = None):
+        self.buckets = buckets or {}
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _buckets(self, name: str) -> tuple:
+        if name in self.buckets:
+            return self.buckets[name]
+        return SECONDS_BUCKETS if name.endswith("_seconds") else COUNT_BUCKETS
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                buckets = self._buckets(name)
+                histogram = self.histograms[key] = [buckets, [0] * len(buckets), 0, 0]
+            buckets, counts, total, n = histogram
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            histogram[2] = total + value
+            histogram[3] = n + 1
+
+    def render(self) -> str:
+        """all the metrics in the Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (buckets, list(counts), total, n))
+                for key, (buckets, counts, total, n) in self.histograms.items()
+            )
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if not name in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, total, n) in histograms:
+            if not name in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(buckets, counts):
+                le = _labels(labels + (("le", _number(bound)),))
+                lines.append(f"{name}_bucket{le} {count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {n}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def blueprint(prometheus_sink: PrometheusSink = None, url: str = "/metrics"):
+    """a Flask blueprint serving the sink's metrics at url"""
+    import flask
+
+    bp = flask.Blueprint("dash_access_metrics", __name__)
+
+    @bp.route(url)
+    def metrics_endpoint():
+        out = prometheus_sink or sink
+        return flask.Response(
+            out.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    return bp
@@ -0,0 +1,50 @@
+"""
+Compact record types for rows read from the access tables
+
+Each is a NamedTuple: no per-row dict, fields in table order,
+and `._asdict()` when a plain dict is needed.
+"""
+
+from typing import NamedTuple
+
+
+class Relationship(NamedTuple):
+    """a row of the relationships table"""
+
+    id: str = None
+    principal: str = None
+    principal_type: str = None
+    granted: str = None
+    granted_type: str = None
+    ts: str = None
+
+
+class AccessEvent(NamedTuple):
+    """a row of the access_events table"""
+
+    user_id: str = None
+    permission: str = None
+    ts: str = None
+    status: bool = None
+
+
+class AdminEvent(NamedTuple):
+    """a row of the admin_events table"""
+
+    ts: str = None
+    table_name: str = None
+    operation: str = None
+    vals: object = None
+    where_val: object = None
+
+
+def record_type(table: str):
+    """the record type for the given table"""
+    records = {
+        "relationships": Relationship,
+        "access_events": AccessEvent,
+        "admin_events": AdminEvent,
+    }
+    if not table in records:
+        raise ValueError(f"record_type: table must be one of {', '.join(records)}")
+    return records[table]
@@ -0,0 +1,116 @@
+"""
+Per-request access-control cost, as a Server-Timing header
+
+counts, for each Flask request (so each Dash callback), the access checks,
+store queries and rows read, and the time spent in each; they're sent back
+in a Server-Timing header, so they show up in the browser devtools'
+network timing tab next to the callback's request
+
+**Example**:
+from dash_access import server_timing
+
+server_timing.init_app(app.server, budget_ms=50)
+
+Server-Timing: dash-access;dur=12.4;desc="7 checks", dash-access-store;dur=9.8;desc="3 queries, 41 rows"
+"""
+
+import time
+import logging
+import flask
+
+# internal
+from dash_access import instrument
+
+logger = logging.getLogger("dash_access.timing")
+
+
+class AccessCost(object):
+    """access-control cost of one request"""
+
+    __slots__ = ("checks", "access_seconds", "queries", "rows", "store_seconds")
+
+    def __init__(self):
+        self.checks = 0
+        self.access_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.store_seconds = 0.0
+
+    def header(self) -> str:
+        """the Server-Timing header value"""
+        return (
+            f'dash-access;dur={self.access_seconds * 1000:.1f};desc="{self.checks} checks", '
+            f"dash-access-store;dur={self.store_seconds * 1000:.1f};"
+            f'desc="{self.queries} queries, {self.rows} rows"'
+        )
+
+
+def init_app(app: flask.Flask, budget_ms: float = None):
+    """
+    add the Server-Timing header to every response of the app
+
+    budget_ms: log requests whose access checks and store queries
+    together take longer than this to the "dash_access.timing" logger
+    """
+    app.config["DASH_ACCESS_TIMING_BUDGET_MS"] = budget_ms
+    app.before_request(_start)
+    app.after_request(_finish)
+    instrument.add_hook(_store_hook)
+    instrument.add_access_hook(_access_hook)
+
+
+def cost() -> AccessCost:
+    """the current request's cost so far, or None outside of a request"""
+    if not flask.has_request_context():
+        return None
+    return flask.g.get("dash_access_cost")
+
+
+def _start():
+    flask.g.dash_access_cost = AccessCost()
+
+
+def _store_hook(call: instrument.StoreCall):
+    out = cost()
+    # nested operations are already counted by the one that made them
+    if out is None or call.nested:
+        return
+    out.queries += 1
+    out.rows += call.rows
+    out.store_seconds += call.seconds
+
+
+def _access_hook(allowed: bool, permissions: int, seconds: float):
+    out = cost()
+    if out is None:
+        return
+    out.checks += 1
+    out.access_seconds += seconds
+
+
+def _finish(response):
+    out = cost()
+    if out is None or (out.checks == 0 and out.queries == 0):
+        return response
+    header = out.header()
+    existing = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = (
+        header if not existing else f"{existing}, {header}"
+    )
+
+    # LOG REQUESTS OVER BUDGET
+    budget_ms = flask.current_app.config.get("DASH_ACCESS_TIMING_BUDGET_MS")
+    # checks include the store queries they make, so take the larger of the two
+    total_ms = max(out.access_seconds, out.store_seconds) * 1000
+    if budget_ms is not None and total_ms > budget_ms:
+        logger.warning(
+            "%s %s over access budget: %.1fms > %sms (%s checks, %s queries, %s rows)",
+            flask.request.method,
+            flask.request.path,
+            total_ms,
+            budget_ms,
+            out.checks,
+            out.queries,
+            out.rows,
+        )
+    return response
@@ -0,0 +1,147 @@
+"""
+Tracing spans and a slow-query log for store operations
+
+once enabled, every store operation becomes a span with its table,
+where columns, row count and duration: an OpenTelemetry span if
+opentelemetry is installed, otherwise a dict passed to a callback.
+Operations slower than slow_seconds are also kept in slow_queries
+and logged to the "dash_access.slow" logger, with the line of
+application code that made them.
+
+**Example**:
+from dash_access import tracing
+
+tracing.enable(slow_seconds=0.05)
+...
+for q in tracing.slow_queries:
+    print(q["seconds"], q["operation"], q["table"], q["caller"])
+"""
+
+import os
+import sys
+import logging
+import datetime
+from collections import deque
+
+# internal
+from dash_access import instrument
+
+logger = logging.getLogger("dash_access.slow")
+
+_tracer = None
+_callback = None
+_slow_seconds = None
+slow_queries = deque(maxlen=100)
+
+_package = os.path.dirname(os.path.abspath(__file__))
+
+
+def enable(
+    callback=None,
+    slow_seconds: float = None,
+    slow_log_size: int = 100,
+    opentelemetry: bool = True,
+):
+    """
+    start tracing store operations
+
+    callback: called with a dict per operation; used instead of OpenTelemetry
+    slow_seconds: keep and log operations slower than this; None for no slow-query log
+    slow_log_size: how many slow operations slow_queries keeps
+    opentelemetry: emit OpenTelemetry spans if the package is installed and no callback is given
+    """
+    global _tracer, _callback, _slow_seconds, slow_queries
+    _callback = callback
+    _tracer = None
+    if callback is None and opentelemetry:
+        try:
+            from opentelemetry import trace
+
+            _tracer = trace.get_tracer("dash_access")
+        except ImportError:
+            pass
+    _slow_seconds = slow_seconds
+    slow_queries = deque(slow_queries, maxlen=slow_log_size)
+    instrument.add_hook(_hook)
+
+
+def disable():
+    """stop tracing; the slow-query log is kept"""
+    global _tracer, _callback
+    instrument.remove_hook(_hook)
+    _tracer = None
+    _callback = None
+
+
+def _caller() -> str:
+    """the first frame outside dash_access, as file:line in function"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if not path.startswith(_package):
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def _attributes(call: instrument.StoreCall) -> dict:
+    return {
+        "dash_access.operation": call.operation,
+        "dash_access.table": str(call.table),
+        "dash_access.where_columns": call.where_columns,
+        "dash_access.rows": call.rows,
+        "dash_access.nested": call.nested,
+    }
+
+
+def _span(call: instrument.StoreCall):
+    end_ns = call.start_ns + int(call.seconds * 1e9)
+    if _tracer is not None:
+        from opentelemetry.trace import Status, StatusCode
+
+        span = _tracer.start_span(
+            f"dash_access.{call.operation}",
+            start_time=call.start_ns,
+            attributes=_attributes(call),
+        )
+        if call.error is not None:
+            span.record_exception(call.error)
+            span.set_status(Status(StatusCode.ERROR, str(call.error)))
+        span.end(end_time=end_ns)
+    elif _callback is not None:
+        _callback(
+            dict(
+                name=f"dash_access.{call.operation}",
+                start_ns=call.start_ns,
+                end_ns=end_ns,
+                seconds=call.seconds,
+                error=call.error,
+                attributes=_attributes(call),
+            )
+        )
+
+
+def _hook(call: instrument.StoreCall):
+    _span(call)
+
+    # SLOW QUERY LOG
+    if _slow_seconds is not None and call.seconds >= _slow_seconds:
+        query = dict(
+            ts=datetime.datetime.now().isoformat(),
+            operation=call.operation,
+            table=call.table,
+            where_columns=call.where_columns,
+            rows=call.rows,
+            seconds=call.seconds,
+            caller=_caller(),
+        )
+        slow_queries.append(query)
+        logger.warning(
+            "slow dash_access %s on %s (%s): %.1fms, %s rows, from %s",
+            query["operation"],
+            query["table"],
+            ", ".join(query["where_columns"]),
+            query["seconds"] * 1000,
+            query["rows"],
+            query["caller"],
+        )
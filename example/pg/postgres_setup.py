@@ -62,8 +62,12 @@ class User(UserMixin, AccessUserMixin, db.Model):
         self.password = generate_password_hash(password)
 
     def check_password(self, password):
-        """Check hashed password."""
-        return check_password_hash(self.password, password)
+        """Check hashed password, rehashing it if the bcrypt cost factor changed."""
+        return check_password_hash(self.password, password, rehash=self.rehash)
+
+    def rehash(self, hashed):
+        self.password = hashed
+        db.session.commit()
 
     @classmethod
     def get(self, user_id: str):